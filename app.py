@@ -1,22 +1,21 @@
 import os
+import json
 import logging
-import tempfile
 from datetime import datetime
 from functools import wraps
-from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_file
+from flask import Flask, render_template, redirect, url_for, flash, request, jsonify, send_file, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import func
+from sqlalchemy import func, case, and_, text
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
-import json
-import zipfile
-import io
 import shutil
+import metrics
+import profiling
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (LOG_LEVEL=DEBUG for verbose output)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
 # Setup SQLAlchemy with the new API
@@ -43,11 +42,26 @@ app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
 app.config["UPLOAD_FOLDER"] = os.path.join(os.path.dirname(os.path.abspath(__file__)), "clips")
 app.config["MAX_CONTENT_LENGTH"] = 500 * 1024 * 1024  # 500MB max upload size
 
+# How long browsers may reuse a clip before revalidating it (revalidation is a cheap 304)
+CLIP_CACHE_MAX_AGE = int(os.environ.get("CLIP_CACHE_MAX_AGE", 3600))
+
+# Clips per page on the review screen
+REVIEW_PAGE_SIZE = int(os.environ.get("REVIEW_PAGE_SIZE", 50))
+# Clips per page in the transcriber's clip list
+CLIP_LIST_PAGE_SIZE = int(os.environ.get("CLIP_LIST_PAGE_SIZE", 100))
+# Audio files per page on the admin dashboard
+AUDIO_PAGE_SIZE = int(os.environ.get("AUDIO_PAGE_SIZE", 25))
+
 # Make sure clips directory exists
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
+# Bearer token required to scrape /metrics (open when unset)
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
 # Initialize extensions
 db.init_app(app)
+metrics.init_app(app)
+profiling.init_app(app)
 
 @app.route('/health')
 def health_check():
@@ -62,7 +76,7 @@ def health_check():
     # Try to check database connection, but don't fail if it's not ready
     try:
         # Simple query to check database connection
-        db.session.execute('SELECT 1')
+        db.session.execute(text('SELECT 1'))
         health_data['database'] = 'connected'
     except Exception as e:
         logger.error(f"Health check - Database error: {str(e)}")
@@ -76,19 +90,42 @@ def health_check():
     }
     health_data['directories'] = dirs_status
     
-    # Log health check for debugging
-    logger.info(f"Health check called: {health_data}")
+    logger.debug(f"Health check called: {health_data}")
     
     return jsonify(health_data), 200
 
+@app.route('/livez')
+def liveness_check():
+    """The process is up and serving requests. Does no I/O."""
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/readyz')
+def readiness_check():
+    """Ready for traffic, judged from a snapshot refreshed in the background (see readiness.py)"""
+    ready, details = readiness_status()
+    return jsonify(details), 200 if ready else 503
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Request, database, upload, clip serving and export metrics of this process (Prometheus format)"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}":
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
 # Import modules (after app is created to avoid circular imports)
-from models import User, Audio, Clip, Transcription
-from forms import LoginForm, RegistrationForm, AudioUploadForm, TranscriptionForm, AssignmentForm
-from audio_processor import process_audio_file
+from models import User, Audio, Clip, Transcription, ProcessingJob, ExportSnapshot
+from forms import LoginForm, RegistrationForm, AudioUploadForm, TranscriptionForm, AssignmentForm, RoundRobinAssignmentForm, ResegmentForm
+from jobs import enqueue_segmentation
+from segmentation import DEFAULT_VAD_PARAMS
+from audio_processor import CLIP_FORMATS, clip_format, clip_mimetype, clip_variant_path, clip_content_hash, open_clip_audio, resolve_clip_path
+from exports import stream_zip, dataset_zip_members, prepare_export, load_snapshot_index
+from stats import status_counts
+from assignment import assign_clips_to_transcriber, assign_clips_round_robin
+from readiness import readiness_status
 
 # Setup Flask-Login
 @login_manager.user_loader
@@ -100,21 +137,8 @@ def load_user(user_id):
 def inject_template_context():
     return {'current_year': datetime.now().year}
 
-# Create tables
-with app.app_context():
-    db.create_all()
-    # Create admin user if doesn't exist
-    admin = User.query.filter_by(username='admin').first()
-    if not admin:
-        admin = User(
-            username='admin',
-            email='admin@example.com',
-            password_hash=generate_password_hash('admin'),
-            role='admin'
-        )
-        db.session.add(admin)
-        db.session.commit()
-        logger.info("Admin user created")
+# Tables, schema upgrades and the admin user are set up by init_db.py (run from
+# prestart.sh), so importing the app never touches the schema
 
 # Health check route for Railway deployment is already defined above
 
@@ -182,20 +206,21 @@ def admin_dashboard():
         flash('You do not have permission to access this page.', 'danger')
         return redirect(url_for('transcriber_dashboard'))
         
-    # Get all audio files
-    audio_files = Audio.query.order_by(Audio.upload_date.desc()).all()
+    # Most recent audio files first, one page at a time
+    page = request.args.get('page', 1, type=int)
+    pagination = Audio.query.order_by(Audio.upload_date.desc()) \
+        .paginate(page=page, per_page=AUDIO_PAGE_SIZE, error_out=False)
+    audio_files = pagination.items
     
-    # Gather overall statistics
-    total_clips = db.session.query(func.count(Clip.id)).scalar() or 0
-    assigned_clips = db.session.query(func.count(Clip.id)).filter(Clip.status != 'unassigned').scalar() or 0
-    submitted_clips = db.session.query(func.count(Clip.id)).filter(Clip.status == 'submitted').scalar() or 0
-    completed_clips = db.session.query(func.count(Clip.id)).filter(Clip.status == 'completed').scalar() or 0
+    # Overall statistics from the maintained status counters
+    counts = status_counts()
+    clip_counts = counts['clip']
+    transcription_counts = counts['transcription']
     
-    # Transcription statistics
-    draft_transcriptions = db.session.query(func.count(Transcription.id)).filter(Transcription.status == 'draft').scalar() or 0
-    submitted_transcriptions = db.session.query(func.count(Transcription.id)).filter(Transcription.status == 'submitted').scalar() or 0
-    approved_transcriptions = db.session.query(func.count(Transcription.id)).filter(Transcription.status == 'approved').scalar() or 0
-    rejected_transcriptions = db.session.query(func.count(Transcription.id)).filter(Transcription.status == 'rejected').scalar() or 0
+    total_clips = sum(clip_counts.values())
+    assigned_clips = total_clips - clip_counts.get('unassigned', 0)
+    submitted_clips = clip_counts.get('submitted', 0)
+    completed_clips = clip_counts.get('completed', 0)
     
     # Calculate percentages for progress bars
     assigned_percentage = (assigned_clips / total_clips * 100) if total_clips > 0 else 0
@@ -207,18 +232,21 @@ def admin_dashboard():
         'assigned_clips': assigned_clips,
         'submitted_clips': submitted_clips,
         'completed_clips': completed_clips,
-        'draft_transcriptions': draft_transcriptions,
-        'submitted_transcriptions': submitted_transcriptions,
-        'approved_transcriptions': approved_transcriptions,
-        'rejected_transcriptions': rejected_transcriptions,
+        'approved_clips': completed_clips,  # Clips are 'completed' once their transcription is approved
+        'draft_transcriptions': transcription_counts.get('draft', 0),
+        'submitted_transcriptions': transcription_counts.get('submitted', 0),
+        'approved_transcriptions': transcription_counts.get('approved', 0),
+        'rejected_transcriptions': transcription_counts.get('rejected', 0),
         'assigned_percentage': assigned_percentage,
         'submitted_percentage': submitted_percentage,
-        'completed_percentage': completed_percentage
+        'completed_percentage': completed_percentage,
+        # Summed over audio files (maintained at segmentation time), not over clips
+        'speech_hours': (db.session.query(func.sum(Audio.speech_seconds)).scalar() or 0) / 3600
     }
     
     form = AudioUploadForm()
     
-    return render_template('admin/dashboard.html', audio_files=audio_files, form=form, stats=stats)
+    return render_template('admin/dashboard.html', audio_files=audio_files, pagination=pagination, form=form, stats=stats)
 
 @app.route('/admin/upload', methods=['POST'])
 @login_required
@@ -247,9 +275,11 @@ def upload_audio():
                 
                 # Save the file
                 logger.info(f"Saving uploaded file to {file_path}")
-                audio_file.save(file_path)
+                with metrics.UPLOAD_SAVE_SECONDS.time():
+                    audio_file.save(file_path)
+                metrics.UPLOAD_BYTES.inc(os.path.getsize(file_path))
                 
-                # Create Audio entry with pending status
+                # Create Audio entry with pending status and queue it for segmentation
                 audio = Audio(
                     filename=unique_filename,
                     original_path=file_path,
@@ -258,33 +288,12 @@ def upload_audio():
                     uploader_id=current_user.id
                 )
                 db.session.add(audio)
+                db.session.flush()
+                enqueue_segmentation(audio)
                 db.session.commit()
                 
-                # Update status to processing
-                audio.status = 'processing'
-                db.session.commit()
-                
-                # Process the audio file
-                logger.info(f"Starting audio processing for {file_path}")
-                clips = process_audio_file(file_path, audio.id, app.config['UPLOAD_FOLDER'])
-                
-                # Update status and save clips to database
-                audio.status = 'processed'
-                audio.clip_count = len(clips)
-                
-                for i, clip_path in enumerate(clips):
-                    clip_filename = os.path.basename(clip_path)
-                    clip = Clip(
-                        audio_id=audio.id,
-                        filename=clip_filename,
-                        path=clip_path,
-                        order=i + 1,
-                        status='unassigned'
-                    )
-                    db.session.add(clip)
-                
-                db.session.commit()
-                flash(f'Audio file processed successfully. {len(clips)} clips were extracted.', 'success')
+                logger.info(f"Queued segmentation job for audio {audio.id}")
+                flash('Audio file uploaded. Speech segmentation has been queued and will finish in the background.', 'success')
                 
             except Exception as e:
                 logger.error(f"Error processing audio: {str(e)}", exc_info=True)
@@ -342,10 +351,11 @@ def delete_audio(audio_id):
         for transcription in transcriptions:
             db.session.delete(transcription)
         
-        # Delete clip file
+        # Delete clip file and its playback copies
         try:
-            if os.path.exists(clip.path):
-                os.remove(clip.path)
+            for path in {clip.path} | {clip_variant_path(clip.path, fmt) for fmt in CLIP_FORMATS}:
+                if os.path.exists(path):
+                    os.remove(path)
         except Exception as e:
             logger.error(f"Error deleting clip file: {str(e)}")
         
@@ -364,6 +374,36 @@ def delete_audio(audio_id):
     flash('Audio file and associated clips deleted successfully.', 'success')
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/audio/<int:audio_id>/status')
+@login_required
+def audio_status(audio_id):
+    """Report segmentation progress for an uploaded audio file (polled by the dashboard)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    audio = Audio.query.get_or_404(audio_id)
+    job = ProcessingJob.query.filter_by(audio_id=audio_id).order_by(ProcessingJob.id.desc()).first()
+    
+    result = {
+        'audio_id': audio.id,
+        'status': audio.status,
+        'clip_count': audio.clip_count,
+        'speech_seconds': audio.speech_seconds,
+        'job': None
+    }
+    if job:
+        result['job'] = {
+            'id': job.id,
+            'status': job.status,
+            'attempts': job.attempts,
+            'max_attempts': job.max_attempts,
+            'error': job.error_message,
+            'created_at': job.created_at.isoformat() if job.created_at else None,
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None
+        }
+    return jsonify(result)
+
 @app.route('/admin/assign/<int:audio_id>')
 @login_required
 def assign_clips(audio_id):
@@ -377,12 +417,15 @@ def assign_clips(audio_id):
     
     form = AssignmentForm()
     form.transcriber.choices = [(t.id, t.username) for t in transcribers]
+    round_robin_form = RoundRobinAssignmentForm()
+    round_robin_form.transcribers.choices = [(t.id, t.username) for t in transcribers]
     
     return render_template('admin/assign.html', 
                           audio=audio, 
                           clips=clips, 
                           transcribers=transcribers, 
-                          form=form)
+                          form=form,
+                          round_robin_form=round_robin_form)
 
 @app.route('/admin/assign_clips', methods=['POST'])
 @login_required
@@ -401,18 +444,13 @@ def assign_clips_post():
             flash('No clips selected.', 'warning')
             return redirect(url_for('admin_dashboard'))
             
-        # Update clip assignments
-        for clip_id in clip_ids:
-            clip = Clip.query.get(int(clip_id))
-            if clip:
-                clip.transcriber_id = transcriber_id
-                clip.status = 'assigned'
-        
+        clip_ids = [int(clip_id) for clip_id in clip_ids]
+        assigned_count = assign_clips_to_transcriber(clip_ids, transcriber_id)
         db.session.commit()
-        flash(f'{len(clip_ids)} clips assigned successfully.', 'success')
+        flash(f'{assigned_count} clips assigned successfully.', 'success')
         
         # Redirect back to the assign page for the same audio
-        sample_clip = Clip.query.get(int(clip_ids[0]))
+        sample_clip = db.session.get(Clip, clip_ids[0])
         return redirect(url_for('assign_clips', audio_id=sample_clip.audio_id))
     
     for field, errors in form.errors.items():
@@ -421,6 +459,27 @@ def assign_clips_post():
     
     return redirect(url_for('admin_dashboard'))
 
+@app.route('/admin/assign_round_robin/<int:audio_id>', methods=['POST'])
+@login_required
+def assign_round_robin_post(audio_id):
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    Audio.query.get_or_404(audio_id)
+    form = RoundRobinAssignmentForm()
+    form.transcribers.choices = [(u.id, u.username) for u in User.query.filter_by(role='transcriber').all()]
+    
+    if form.validate_on_submit():
+        assigned_count = assign_clips_round_robin(audio_id, form.transcribers.data, limit=form.count.data)
+        db.session.commit()
+        flash(f'{assigned_count} clips distributed across {len(form.transcribers.data)} transcribers.', 'success')
+    else:
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f"{field}: {error}", 'danger')
+    
+    return redirect(url_for('assign_clips', audio_id=audio_id))
+
 @app.route('/admin/review')
 @login_required
 def review_transcriptions():
@@ -443,23 +502,130 @@ def review_audio_transcriptions(audio_id):
         return redirect(url_for('transcriber_dashboard'))
         
     audio = Audio.query.get_or_404(audio_id)
-    clips = Clip.query.filter_by(audio_id=audio_id).order_by(Clip.order).all()
+    pagination = _review_clip_page(audio_id)
     
-    # Get all transcriptions for these clips
-    clip_data = []
-    for clip in clips:
-        transcription = Transcription.query.filter_by(clip_id=clip.id).first()
-        transcriber = User.query.get(clip.transcriber_id) if clip.transcriber_id else None
-        
-        clip_data.append({
-            'clip': clip,
-            'transcription': transcription,
-            'transcriber': transcriber
-        })
+    clip_data = [
+        {'clip': clip, 'transcription': transcription, 'transcriber': transcriber}
+        for clip, transcription, transcriber in pagination.items
+    ]
+    
+    resegment_form = None
+    if audio.status == 'processed' and not _audio_has_transcriptions(audio_id):
+        resegment_form = ResegmentForm(data={**DEFAULT_VAD_PARAMS, **json.loads(audio.vad_params or '{}')})
     
     return render_template('admin/review.html', 
                           audio=audio,
-                          clip_data=clip_data)
+                          clip_data=clip_data,
+                          pagination=pagination,
+                          stats=_clip_status_stats(audio_id),
+                          resegment_form=resegment_form)
+
+def _audio_has_transcriptions(audio_id):
+    return db.session.query(Transcription.id) \
+        .join(Clip, Clip.id == Transcription.clip_id) \
+        .filter(Clip.audio_id == audio_id) \
+        .first() is not None
+
+@app.route('/admin/resegment/<int:audio_id>', methods=['POST'])
+@login_required
+def resegment_audio(audio_id):
+    """Queue a re-segmentation of an audio file with new VAD parameters (reuses its cached speech probabilities)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    audio = Audio.query.get_or_404(audio_id)
+    form = ResegmentForm()
+    if not form.validate_on_submit():
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f"{field}: {error}", 'danger')
+        return redirect(url_for('review_audio_transcriptions', audio_id=audio_id))
+    
+    if audio.status != 'processed':
+        flash('This audio file is still being processed.', 'warning')
+        return redirect(url_for('review_audio_transcriptions', audio_id=audio_id))
+    # Re-segmenting replaces every clip, so it is only allowed before transcription starts
+    if _audio_has_transcriptions(audio_id):
+        flash('Clips of this audio file already have transcriptions and cannot be re-segmented.', 'danger')
+        return redirect(url_for('review_audio_transcriptions', audio_id=audio_id))
+    
+    vad_params = {name: getattr(form, name).data for name in DEFAULT_VAD_PARAMS if hasattr(form, name)}
+    vad_params = {name: value for name, value in vad_params.items() if value is not None}
+    audio.status = 'pending'
+    enqueue_segmentation(audio, vad_params=vad_params)
+    db.session.commit()
+    logger.info(f"Re-segmentation of audio {audio_id} queued with {vad_params}")
+    flash(f'Re-segmentation of {audio.filename} queued.', 'info')
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/review_audio/<int:audio_id>/clips')
+@login_required
+def review_audio_clips(audio_id):
+    """JSON version of the review page, for the admin JS"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    audio = Audio.query.get_or_404(audio_id)
+    pagination = _review_clip_page(audio_id)
+    
+    clips = []
+    for clip, transcription, transcriber in pagination.items:
+        clips.append({
+            'id': clip.id,
+            'order': clip.order,
+            'status': clip.status,
+            'url': url_for('serve_clip', clip_id=clip.id),
+            'transcriber': transcriber.username if transcriber else None,
+            'transcription': {
+                'id': transcription.id,
+                'text': transcription.text,
+                'status': transcription.status
+            } if transcription else None
+        })
+    
+    return jsonify({
+        'audio_id': audio.id,
+        'filename': audio.filename,
+        'page': pagination.page,
+        'per_page': pagination.per_page,
+        'pages': pagination.pages,
+        'total': pagination.total,
+        'stats': _clip_status_stats(audio_id),
+        'clips': clips
+    })
+
+def _review_clip_page(audio_id):
+    """
+    One page of (clip, transcription, transcriber) rows for an audio file.
+    Loaded with a single joined query (plus a count), however many clips the audio has.
+    """
+    page = request.args.get('page', 1, type=int)
+    per_page = min(request.args.get('per_page', REVIEW_PAGE_SIZE, type=int), 200)
+    
+    query = db.session.query(Clip, Transcription, User) \
+        .outerjoin(Transcription, Transcription.clip_id == Clip.id) \
+        .outerjoin(User, User.id == Clip.transcriber_id) \
+        .filter(Clip.audio_id == audio_id) \
+        .order_by(Clip.order)
+    return query.paginate(page=page, per_page=per_page, error_out=False)
+
+def _clip_status_stats(audio_id):
+    """Clip counts and speech minutes per review stage for an audio file, aggregated in SQL"""
+    rows = db.session.query(Clip.status, func.count(Clip.id), func.sum(Clip.duration)) \
+        .filter(Clip.audio_id == audio_id) \
+        .group_by(Clip.status) \
+        .all()
+    counts = {status: count for status, count, _ in rows}
+    seconds = {status: duration or 0 for status, _, duration in rows}
+    total = sum(counts.values())
+    return {
+        'total': total,
+        'assigned': total - counts.get('unassigned', 0),
+        'submitted': counts.get('submitted', 0),
+        'completed': counts.get('completed', 0),
+        'total_minutes': sum(seconds.values()) / 60,
+        'completed_minutes': seconds.get('completed', 0) / 60
+    }
 
 @app.route('/admin/approve_transcription/<int:transcription_id>', methods=['POST'])
 @login_required
@@ -513,38 +679,13 @@ def export_dataset(audio_id):
         return redirect(url_for('transcriber_dashboard'))
         
     audio = Audio.query.get_or_404(audio_id)
+    audio_format = request.args.get('audio_format', 'wav')  # 'wav' or 'original'
     
-    # Create a zip file in memory
-    memory_file = io.BytesIO()
-    
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        # Create JSONL file
-        jsonl_data = []
-        included_count = 0
-        total_count = 0
-        
-        clips = Clip.query.filter_by(audio_id=audio_id).order_by(Clip.order).all()
-        total_count = len(clips)
-        
-        for clip in clips:
-            transcription = Transcription.query.filter_by(clip_id=clip.id, status='approved').first()
-            if transcription:
-                entry = {
-                    "audio_filepath": clip.filename,
-                    "text": transcription.text
-                }
-                jsonl_data.append(entry)
-                included_count += 1
-                
-                # Add the audio clip to the zip file
-                if os.path.exists(clip.path):
-                    zf.write(clip.path, clip.filename)
-        
-        # Write JSONL to the zip file
-        jsonl_content = '\n'.join([json.dumps(entry) for entry in jsonl_data])
-        zf.writestr('dataset.jsonl', jsonl_content)
-    
-    memory_file.seek(0)
+    # Counts for the flash message, in one query
+    total_count, included_count = db.session.query(func.count(Clip.id), func.count(Transcription.id)) \
+        .outerjoin(Transcription, and_(Transcription.clip_id == Clip.id, Transcription.status == 'approved')) \
+        .filter(Clip.audio_id == audio_id) \
+        .one()
     
     # Flash a message about how many clips were included
     if included_count == 0:
@@ -552,12 +693,23 @@ def export_dataset(audio_id):
     else:
         flash(f'Success: Exported {included_count} out of {total_count} clips. Only approved transcriptions are included in the dataset.', 'success')
     
-    return send_file(
-        memory_file,
-        mimetype='application/zip',
-        as_attachment=True,
-        download_name=f'whisper_dataset_{audio.filename}.zip'
-    )
+    rows = ((clip.path, clip.span, clip.filename, text) for clip, text in _approved_clips(Clip.audio_id == audio_id))
+    members = dataset_zip_members(rows, 'dataset.jsonl', manifest_style='jsonl', audio_format=audio_format)
+    return _zip_response(members, f'whisper_dataset_{audio.filename}.zip', 'audio_jsonl')
+
+def _approved_clips(*criteria):
+    """Clips with an approved transcription, streamed in batches with their text"""
+    return db.session.query(Clip, Transcription.text) \
+        .join(Transcription, Transcription.clip_id == Clip.id) \
+        .filter(Transcription.status == 'approved', *criteria) \
+        .order_by(Clip.audio_id, Clip.order) \
+        .yield_per(500)
+
+def _zip_response(members, download_name, kind):
+    """Stream an archive to the client as it is built"""
+    response = Response(stream_with_context(metrics.timed_stream(stream_zip(members), kind)), mimetype='application/zip')
+    response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    return response
 
 # Transcriber routes
 @app.route('/transcriber/dashboard')
@@ -566,39 +718,27 @@ def transcriber_dashboard():
     if current_user.role != 'transcriber':
         return redirect(url_for('admin_dashboard'))
         
-    # Get all clips assigned to this transcriber
-    assigned_clips = Clip.query.filter_by(transcriber_id=current_user.id).all()
+    # Per-audio progress for this transcriber, aggregated in a single query
+    completed = func.sum(case((Transcription.status.in_(['submitted', 'approved']), 1), else_=0))
+    rows = db.session.query(Audio, func.count(Clip.id), completed) \
+        .join(Clip, Clip.audio_id == Audio.id) \
+        .outerjoin(Transcription, Transcription.clip_id == Clip.id) \
+        .filter(Clip.transcriber_id == current_user.id) \
+        .group_by(Audio.id) \
+        .order_by(Audio.upload_date.desc()) \
+        .all()
     
-    # Group clips by audio
     clips_by_audio = {}
-    for clip in assigned_clips:
-        audio = Audio.query.get(clip.audio_id)
-        if audio.id not in clips_by_audio:
-            clips_by_audio[audio.id] = {
-                'audio': audio,
-                'clips': [],
-                'progress': {
-                    'total': 0,
-                    'completed': 0,
-                    'pending': 0
-                }
+    for audio, total, completed_count in rows:
+        completed_count = int(completed_count or 0)
+        clips_by_audio[audio.id] = {
+            'audio': audio,
+            'progress': {
+                'total': total,
+                'completed': completed_count,
+                'pending': total - completed_count
             }
-        
-        # Add clip to list
-        clips_by_audio[audio.id]['clips'].append(clip)
-        
-        # Update progress counters
-        clips_by_audio[audio.id]['progress']['total'] += 1
-        
-        # Check if this clip has a transcription
-        transcription = Transcription.query.filter_by(clip_id=clip.id).first()
-        if transcription:
-            if transcription.status in ['submitted', 'approved']:
-                clips_by_audio[audio.id]['progress']['completed'] += 1
-            else:
-                clips_by_audio[audio.id]['progress']['pending'] += 1
-        else:
-            clips_by_audio[audio.id]['progress']['pending'] += 1
+        }
     
     return render_template('transcriber/dashboard.html', clips_by_audio=clips_by_audio)
 
@@ -610,22 +750,20 @@ def transcribe_audio(audio_id):
         
     audio = Audio.query.get_or_404(audio_id)
     
-    # Get all clips for this audio assigned to the current transcriber
-    clips = Clip.query.filter_by(
-        audio_id=audio_id, 
-        transcriber_id=current_user.id
-    ).order_by(Clip.order).all()
+    # One page of this transcriber's clips for the audio, with their transcriptions
+    page = request.args.get('page', 1, type=int)
+    pagination = db.session.query(Clip, Transcription) \
+        .outerjoin(Transcription, Transcription.clip_id == Clip.id) \
+        .filter(Clip.audio_id == audio_id, Clip.transcriber_id == current_user.id) \
+        .order_by(Clip.order) \
+        .paginate(page=page, per_page=CLIP_LIST_PAGE_SIZE, error_out=False)
     
-    if not clips:
+    if not pagination.total:
         flash('No clips assigned to you for this audio.', 'warning')
         return redirect(url_for('transcriber_dashboard'))
     
-    # Get existing transcriptions for these clips
-    transcriptions = {}
-    for clip in clips:
-        transcription = Transcription.query.filter_by(clip_id=clip.id).first()
-        if transcription:
-            transcriptions[clip.id] = transcription
+    clips = [clip for clip, _ in pagination.items]
+    transcriptions = {clip.id: transcription for clip, transcription in pagination.items if transcription}
     
     form = TranscriptionForm()
     
@@ -633,6 +771,7 @@ def transcribe_audio(audio_id):
                           audio=audio, 
                           clips=clips, 
                           transcriptions=transcriptions,
+                          pagination=pagination,
                           form=form)
 
 @app.route('/transcriber/save_transcription', methods=['POST'])
@@ -695,34 +834,82 @@ def save_transcription():
 @app.route('/clips/<int:clip_id>')
 @login_required
 def serve_clip(clip_id):
-    """Serve an audio clip file"""
+    """Serve an audio clip file, with byte ranges and 304 revalidation"""
     clip = Clip.query.get_or_404(clip_id)
     
     # Security check: Only allow access if the user is an admin or the assigned transcriber
     if not (current_user.role == 'admin' or current_user.id == clip.transcriber_id):
         return jsonify({'error': 'Unauthorized'}), 403
     
-    # Handle both absolute and relative paths
-    # Try the original path first
-    clip_path = clip.path
-    
-    # If the path is absolute but file doesn't exist, try to find it relative to project root
-    if os.path.isabs(clip_path) and not os.path.exists(clip_path):
-        # Extract the part after the last directory containing 'clips'
-        parts = clip_path.split('clips')
-        if len(parts) > 1:
-            relative_path = os.path.join('clips', parts[-1].lstrip('/'))
-            if os.path.exists(relative_path):
-                clip_path = relative_path
-                logger.info(f"Using relative path instead: {clip_path}")
-    
-    # Check if file exists
-    if not os.path.exists(clip_path):
-        logger.error(f"Clip file not found: Original path: {clip.path}, Tried: {clip_path}")
+    clip_path = resolve_clip_path(clip.path)
+    if clip_path is None:
+        logger.error(f"Clip file not found: {clip.path}")
         return jsonify({'error': 'File not found'}), 404
     
-    # Serve the file from its location on disk
-    return send_file(clip_path, mimetype='audio/wav')
+    # Clips written before hashes were recorded get theirs on first request
+    if not clip.content_hash:
+        clip.content_hash = clip_content_hash(clip_path, clip.span)
+        db.session.commit()
+    
+    if clip.virtual:
+        response = _virtual_clip_response(clip, clip_path)
+        response.cache_control.public = False
+        response.cache_control.private = True
+        metrics.CLIP_BYTES_SERVED.inc(response.content_length or 0, format='wav', status=response.status_code)
+        return response
+    
+    # Serve a compressed playback copy when the client asks for one (?format=opus or Accept header)
+    requested_format = request.args.get('format') or _preferred_clip_format()
+    if requested_format in CLIP_FORMATS and requested_format != clip_format(clip_path):
+        variant_path = clip_variant_path(clip_path, requested_format)
+        if os.path.exists(variant_path):
+            clip_path = variant_path
+    
+    # Variants are encoded from the same samples as the stored clip, so the
+    # stored clip's hash plus the format identifies every representation.
+    # send_file answers Range requests with 206 and matching If-None-Match /
+    # If-Modified-Since with 304.
+    response = send_file(
+        os.path.abspath(clip_path),
+        mimetype=clip_mimetype(clip_path),
+        conditional=True,
+        etag=f"{clip.content_hash}-{clip_format(clip_path)}",
+        max_age=CLIP_CACHE_MAX_AGE
+    )
+    # Clips are only visible to their transcriber and admins: no shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.vary.add('Accept')
+    metrics.CLIP_BYTES_SERVED.inc(response.content_length or 0, format=clip_format(clip_path), status=response.status_code)
+    return response
+
+def _virtual_clip_response(clip, source_path):
+    """
+    Serve a virtual clip as a WAV file synthesized from its slice of the source
+    recording, with the same byte range and 304 handling as clip files
+    """
+    audio_file = open_clip_audio(source_path, clip.span)
+    response = send_file(
+        audio_file,
+        mimetype=CLIP_FORMATS['wav'][1],
+        download_name=clip.filename,
+        conditional=False,
+        etag=False,
+        last_modified=os.path.getmtime(source_path),
+        max_age=CLIP_CACHE_MAX_AGE
+    )
+    # send_file cannot size a file object, so ranges are resolved here
+    response.content_length = audio_file.size
+    response.set_etag(f"{clip.content_hash}-wav")
+    return response.make_conditional(request, accept_ranges=True, complete_length=audio_file.size)
+
+def _preferred_clip_format():
+    """Clip format explicitly listed in the Accept header (browsers usually just send */*)"""
+    accepted = set(request.accept_mimetypes.values())
+    for fmt, (_, mimetype) in CLIP_FORMATS.items():
+        if mimetype.split(';')[0] in accepted:
+            return fmt
+    return None
 
 @app.route('/')
 def index():
@@ -744,43 +931,14 @@ def export_zip_dataset(audio_id):
         return redirect(url_for('transcriber_dashboard'))
         
     audio = Audio.query.get_or_404(audio_id)
+    audio_format = request.args.get('audio_format', 'wav')  # 'wav' or 'original'
     
-    # Create a temporary zip file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-    temp_file.close()
-    
-    # Create a zip file
-    with zipfile.ZipFile(temp_file.name, 'w') as zipf:
-        clips = Clip.query.filter_by(audio_id=audio_id).all()
-        
-        # Create a metadata JSON file
-        dataset = []
-        for clip in clips:
-            transcription = Transcription.query.filter_by(clip_id=clip.id, status='approved').first()
-            if transcription:
-                # Get relative path for audio file
-                audio_path = clip.path
-                # Create a filename for the destination in the zip
-                zip_audio_path = f"audio/{os.path.basename(audio_path)}"
-                
-                # Add audio file to zip
-                zipf.write(audio_path, zip_audio_path)
-                
-                # Add entry to dataset
-                dataset.append({
-                    'audio_filepath': zip_audio_path,
-                    'text': transcription.text
-                })
-        
-        # Add dataset.json
-        if dataset:
-            zipf.writestr('dataset.json', json.dumps(dataset, indent=2))
-    
-    # Send the zip file
-    return send_file(temp_file.name, 
-                     mimetype='application/zip',
-                     as_attachment=True, 
-                     download_name=f'dataset_{audio.filename}_{datetime.now().strftime("%Y%m%d")}.zip')
+    rows = (
+        (clip.path, clip.span, f"audio/{clip.filename}", text)
+        for clip, text in _approved_clips(Clip.audio_id == audio_id)
+    )
+    members = dataset_zip_members(rows, 'dataset.json', audio_format=audio_format)
+    return _zip_response(members, f'dataset_{audio.filename}_{datetime.now().strftime("%Y%m%d")}.zip', 'audio')
 
 @app.route('/admin/export_all_zip')
 @login_required
@@ -789,41 +947,60 @@ def export_all_zip_dataset():
         flash('You do not have permission to access this page.', 'danger')
         return redirect(url_for('transcriber_dashboard'))
     
-    # Create a temporary zip file
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.zip')
-    temp_file.close()
+    audio_format = request.args.get('audio_format', 'wav')  # 'wav' or 'original'
     
-    # Create a zip file
-    with zipfile.ZipFile(temp_file.name, 'w') as zipf:
-        # Get all approved transcriptions across all audio files
-        dataset = []
-        transcriptions = Transcription.query.filter_by(status='approved').all()
-        
-        for transcription in transcriptions:
-            clip = Clip.query.get(transcription.clip_id)
-            if clip:
-                # Get relative path for audio file
-                audio_path = clip.path
-                # Create a filename for the destination in the zip
-                audio_name = os.path.basename(audio_path)
-                audio_id = clip.audio_id
-                zip_audio_path = f"audio/{audio_id}/{audio_name}"
-                
-                # Add audio file to zip
-                zipf.write(audio_path, zip_audio_path)
-                
-                # Add entry to dataset
-                dataset.append({
-                    'audio_filepath': zip_audio_path,
-                    'text': transcription.text
-                })
-        
-        # Add dataset.json
-        if dataset:
-            zipf.writestr('dataset.json', json.dumps(dataset, indent=2))
-    
-    # Send the zip file
-    return send_file(temp_file.name, 
-                     mimetype='application/zip',
-                     as_attachment=True, 
-                     download_name=f'complete_dataset_{datetime.now().strftime("%Y%m%d")}.zip')
+    # Rebuilt incrementally from the export cache; ?since=<export id> gives only the changes
+    base = None
+    since = request.args.get('since', type=int)
+    if since is not None:
+        base = db.session.get(ExportSnapshot, since)
+        if base is None or base.status != 'ready' or load_snapshot_index(base) is None:
+            flash(f'Export {since} is not available for a delta export. Download the complete dataset instead.', 'warning')
+            return redirect(url_for('review_transcriptions'))
+    
+    snapshot, chunks = prepare_export(audio_format, base=base, user_id=current_user.id)
+    if base is None:
+        download_name = f'complete_dataset_{datetime.now().strftime("%Y%m%d")}_export{snapshot.id}.zip'
+    else:
+        download_name = f'dataset_changes_since_export{base.id}_export{snapshot.id}.zip'
+    
+    kind = 'full' if base is None else 'delta'
+    if chunks is None:
+        response = send_file(snapshot.path, mimetype='application/zip', as_attachment=True,
+                             download_name=download_name, conditional=True, etag=snapshot.fingerprint)
+        metrics.EXPORT_BYTES.inc(response.content_length or 0, kind=f'{kind}_cached')
+    else:
+        response = Response(stream_with_context(metrics.timed_stream(chunks, kind)), mimetype='application/zip')
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.headers['X-Export-Id'] = str(snapshot.id)
+    return response
+
+@app.route('/admin/debug/sql_profile')
+@login_required
+def sql_profile():
+    """Query profiles of the last requests handled by this process (?slow=1 for slow ones only)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    if not profiling.SQL_PROFILING:
+        return jsonify({'error': 'SQL profiling is disabled (set SQL_PROFILING=1)'}), 404
+    return jsonify({'requests': profiling.recent_profiles(slow_only=request.args.get('slow') == '1')})
+
+@app.route('/admin/exports')
+@login_required
+def list_exports():
+    """Stored full-dataset exports, newest first (ids can be passed as ?since= for a delta)"""
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    snapshots = ExportSnapshot.query.filter_by(status='ready').order_by(ExportSnapshot.id.desc()).limit(50).all()
+    return jsonify({'exports': [{
+        'id': snapshot.id,
+        'kind': snapshot.kind,
+        'since': snapshot.base_id,
+        'audio_format': snapshot.audio_format,
+        'entries': snapshot.entry_count,
+        'removed': snapshot.removed_count,
+        'size_bytes': snapshot.size_bytes,
+        'archived': snapshot.path is not None,
+        'created_at': snapshot.created_at.isoformat() if snapshot.created_at else None
+    } for snapshot in snapshots]})
@@ -0,0 +1,75 @@
+import logging
+from collections import Counter
+from sqlalchemy import select, update, case, func
+from app import db
+from models import Clip
+from stats import record_status_changes
+
+logger = logging.getLogger(__name__)
+
+# Clips in these states can be (re)assigned; later ones already carry a transcription in review
+ASSIGNABLE_STATUSES = ('unassigned', 'assigned')
+
+
+def assign_clips_to_transcriber(clip_ids, transcriber_id):
+    """
+    Assign the given clips to one transcriber with a single UPDATE.
+    Clips that are already submitted or completed are left alone.
+    The caller commits.
+
+    Returns:
+        int: number of clips assigned
+    """
+    clip_ids = list(clip_ids)
+    if not clip_ids:
+        return 0
+
+    condition = (Clip.id.in_(clip_ids), Clip.status.in_(ASSIGNABLE_STATUSES))
+    previous = Counter(dict(
+        db.session.query(Clip.status, func.count(Clip.id)).filter(*condition).group_by(Clip.status).all()
+    ))
+
+    result = db.session.execute(
+        update(Clip)
+        .where(*condition)
+        .values(transcriber_id=transcriber_id, status='assigned')
+        .execution_options(synchronize_session=False)
+    )
+    record_status_changes(Clip, {'unassigned': -previous['unassigned'], 'assigned': previous['unassigned']})
+    return result.rowcount
+
+
+def assign_clips_round_robin(audio_id, transcriber_ids, limit=None):
+    """
+    Deal the unassigned clips of an audio file out to the transcribers in turn,
+    in clip order, with a single UPDATE ... FROM statement.
+    `limit` caps the number of clips assigned. The caller commits.
+
+    Returns:
+        int: number of clips assigned
+    """
+    transcriber_ids = list(transcriber_ids)
+    if not transcriber_ids:
+        return 0
+
+    position = func.row_number().over(order_by=Clip.order) - 1
+    pending = select(Clip.id.label('clip_id'), position.label('position')) \
+        .where(Clip.audio_id == audio_id, Clip.status == 'unassigned') \
+        .order_by(Clip.order)
+    if limit:
+        pending = pending.limit(limit)
+    pending = pending.subquery()
+
+    transcriber = case(
+        {i: transcriber_id for i, transcriber_id in enumerate(transcriber_ids)},
+        value=pending.c.position % len(transcriber_ids)
+    )
+    result = db.session.execute(
+        update(Clip)
+        .where(Clip.id == pending.c.clip_id)
+        .values(transcriber_id=transcriber, status='assigned')
+        .execution_options(synchronize_session=False)
+    )
+    record_status_changes(Clip, {'unassigned': -result.rowcount, 'assigned': result.rowcount})
+    logger.info(f"Assigned {result.rowcount} clips of audio {audio_id} round-robin to {len(transcriber_ids)} transcribers")
+    return result.rowcount
@@ -1,40 +1,102 @@
+import io
 import os
+import re
+import mmap
+import time
+import wave
+import struct
+import hashlib
 import logging
 import shutil
+import threading
 import subprocess
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from urllib.parse import urlparse
+import numpy as np
+from segmentation import frame_samples_for, speech_regions_from_probs, StreamingRegionTracker, DEFAULT_VAD_PARAMS
+from metrics import SEGMENTATION_STAGE_SECONDS
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-# Check if FFmpeg is available
-try:
-    subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    FFMPEG_AVAILABLE = True
-except (FileNotFoundError, subprocess.SubprocessError):
-    logger.warning("FFmpeg not found. Audio processing functionality will be limited.")
-    FFMPEG_AVAILABLE = False
+# Streaming segmentation: 'auto' streams files of at least VAD_STREAMING_MIN_BYTES,
+# 'always' / 'never' force the mode
+STREAMING_MODE = os.environ.get("VAD_STREAMING", "auto")
+STREAMING_MIN_BYTES = int(os.environ.get("VAD_STREAMING_MIN_BYTES", 64 * 1024 * 1024))
+STREAMING_WINDOW_SECONDS = int(os.environ.get("VAD_STREAMING_WINDOW_SECONDS", 30))
 
-# Initialize variables to avoid LSP errors
-TORCH_AVAILABLE = False
+# Number of threads encoding and writing clips in parallel
+CLIP_WRITE_WORKERS = int(os.environ.get("CLIP_WRITE_WORKERS", 4))
+
+# Clip storage: CLIP_STORAGE_FORMAT is the format Clip.path points to (wav, flac or opus);
+# CLIP_PLAYBACK_FORMATS lists extra copies written next to it for playback (e.g. "opus")
+CLIP_FORMATS = {
+    'wav': ('.wav', 'audio/wav'),
+    'flac': ('.flac', 'audio/flac'),
+    'opus': ('.opus', 'audio/ogg; codecs=opus'),
+}
+CLIP_STORAGE_FORMAT = os.environ.get("CLIP_STORAGE_FORMAT", "wav").lower()
+CLIP_PLAYBACK_FORMATS = [f.strip().lower() for f in os.environ.get("CLIP_PLAYBACK_FORMATS", "").split(",")
+                         if f.strip() and f.strip().lower() != CLIP_STORAGE_FORMAT]
+CLIP_OPUS_BITRATE = os.environ.get("CLIP_OPUS_BITRATE", "24k")
+
+# 'files' writes every clip to its own file; 'virtual' normalizes each recording once
+# to a 16-bit mono PCM WAV (SOURCE_PCM_FILENAME) and stores clips as sample ranges of it
+CLIP_STORAGE_MODE = os.environ.get("CLIP_STORAGE_MODE", "files").lower()
+SOURCE_PCM_FILENAME = "source.wav"
+# Per-frame speech probabilities of a recording, kept for re-segmentation
+VAD_PROBS_FILENAME = "vad_probs.npy"
+
+# torch / torchaudio are imported on first use by the segmentation path, so the web
+# tier (which only serves and exports clips) starts without loading them
 torch = None
 torchaudio = None
 download_url_to_file = None
 
-# Try to import torch and torchaudio, but provide fallbacks if they're not available
-try:
-    import torch
-    from torch.hub import download_url_to_file
-    import torchaudio
-    TORCH_AVAILABLE = True
-except ImportError:
-    logger.warning("Torch/torchaudio not available. Audio processing functionality will be limited.")
+_probe_lock = threading.Lock()
+_torch_available = None
+_ffmpeg_available = None
+
+def torch_available():
+    """Import torch and torchaudio on the first call; returns whether they are installed"""
+    global torch, torchaudio, download_url_to_file, _torch_available
+    if _torch_available is not None:
+        return _torch_available
+    
+    with _probe_lock:
+        if _torch_available is None:
+            start_time = time.perf_counter()
+            try:
+                import torch
+                from torch.hub import download_url_to_file
+                import torchaudio
+                _torch_available = True
+                logger.info(f"Torch imported in {time.perf_counter() - start_time:.2f}s (pid {os.getpid()})")
+            except ImportError:
+                logger.warning("Torch/torchaudio not available. Audio processing functionality will be limited.")
+                _torch_available = False
+    return _torch_available
+
+def ffmpeg_available():
+    """Whether the ffmpeg binary can be run; probed once per process, on the first call"""
+    global _ffmpeg_available
+    if _ffmpeg_available is not None:
+        return _ffmpeg_available
+    
+    with _probe_lock:
+        if _ffmpeg_available is None:
+            try:
+                subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                _ffmpeg_available = True
+            except (FileNotFoundError, subprocess.SubprocessError):
+                logger.warning("FFmpeg not found. Audio processing functionality will be limited.")
+                _ffmpeg_available = False
+    return _ffmpeg_available
 
 def download_if_not_exists(url, target_path):
     """Download a file from URL if it doesn't exist"""
-    if not TORCH_AVAILABLE:
+    if not torch_available():
         logger.warning("Torch not available, cannot download files")
         return False
         
@@ -48,9 +110,60 @@ def download_if_not_exists(url, target_path):
             return False
     return True
 
+# Process-wide VAD model registry. The model is loaded once per process (or once in a
+# parent process before forking, in which case children share the weights copy-on-write).
+_vad_model_lock = threading.Lock()
+_vad_model_cache = None
+
 def get_silero_vad_model():
-    """Get the Silero VAD model, downloading if necessary"""
-    if not TORCH_AVAILABLE:
+    """
+    Get the Silero VAD model and its helper functions.
+    The model is only deserialized on the first call; later calls return the cached copy.
+    """
+    global _vad_model_cache
+    if _vad_model_cache is not None:
+        return _vad_model_cache
+    
+    with _vad_model_lock:
+        if _vad_model_cache is None:
+            start_time = time.perf_counter()
+            _vad_model_cache = _load_silero_vad_model()
+            logger.info(f"Silero VAD model loaded in {time.perf_counter() - start_time:.2f}s (pid {os.getpid()})")
+    return _vad_model_cache
+
+def vad_model_loaded():
+    """Whether the VAD model has already been loaded in this process"""
+    return _vad_model_cache is not None
+
+def warm_up_vad_model(run_inference=True):
+    """
+    Load the VAD model ahead of the first upload.
+    
+    Call with run_inference=False in a parent process before forking (gunicorn master,
+    job worker pool) so the weights are loaded once and shared copy-on-write. Inference
+    should only be run after the fork, since torch thread pools do not survive fork().
+    Returns True if the model is ready.
+    """
+    if not torch_available():
+        logger.warning("Torch not available, skipping VAD model warm-up")
+        return False
+    try:
+        vad_model = get_silero_vad_model()[0]
+        if run_inference:
+            start_time = time.perf_counter()
+            with torch.no_grad():
+                vad_model(torch.zeros(512), 16000)
+            if hasattr(vad_model, 'reset_states'):
+                vad_model.reset_states()
+            logger.info(f"VAD model warm-up inference took {time.perf_counter() - start_time:.2f}s")
+        return True
+    except Exception as e:
+        logger.error(f"VAD model warm-up failed: {str(e)}")
+        return False
+
+def _load_silero_vad_model():
+    """Load the Silero VAD model from torch.hub, falling back to a direct download"""
+    if not torch_available():
         raise ImportError("Torch is not available, cannot use silero-vad model")
     try:
         vad_model, utils = torch.hub.load('snakers4/silero-vad', 'silero_vad', force_reload=False)
@@ -67,69 +180,19 @@ def get_silero_vad_model():
                 vad_model = torch.jit.load(local_path)
                 def get_speech_timestamps(audio, model, sampling_rate=16000, threshold=0.5, min_speech_duration_ms=250, **kwargs):
                     """Get speech timestamps using silero VAD model"""
-                    model.eval()
-                    
                     # Ensure audio is correct shape
                     if len(audio.shape) > 1:
                         audio = audio[0]  # Take first channel
                     
-                    # Process in chunks to avoid memory issues
-                    window_size_samples = sampling_rate * 30  # 30 seconds
-                    speech_timestamps = []
-                    
-                    for i in range(0, len(audio), window_size_samples):
-                        chunk = audio[i:i+window_size_samples]
-                        # Move to same device as model
-                        chunk = chunk.to(next(model.parameters()).device)
-                        
-                        # Get VAD predictions
-                        with torch.no_grad():
-                            speech_prob = model(chunk, sampling_rate)
-                        
-                        # Get timestamps where speech prob > threshold
-                        mask = (speech_prob > threshold).int()
-                        
-                        # Find contiguous regions of speech
-                        starts = []
-                        ends = []
-                        in_speech = False
-                        for j, val in enumerate(mask):
-                            if val == 1 and not in_speech:
-                                starts.append(j)
-                                in_speech = True
-                            elif val == 0 and in_speech:
-                                ends.append(j)
-                                in_speech = False
-                        
-                        if in_speech:  # If audio ends during speech
-                            ends.append(len(mask))
-                        
-                        # Convert to original audio index
-                        for start, end in zip(starts, ends):
-                            speech_timestamps.append({
-                                'start': i + start,
-                                'end': i + end
-                            })
-                    
-                    # Merge overlapping segments
-                    if speech_timestamps:
-                        merged_timestamps = [speech_timestamps[0]]
-                        for ts in speech_timestamps[1:]:
-                            last_end = merged_timestamps[-1]['end']
-                            if ts['start'] <= last_end:
-                                merged_timestamps[-1]['end'] = max(last_end, ts['end'])
-                            else:
-                                # Only keep segments longer than min_speech_duration_ms
-                                if (merged_timestamps[-1]['end'] - merged_timestamps[-1]['start']) * 1000 / sampling_rate >= min_speech_duration_ms:
-                                    merged_timestamps.append(ts)
-                        
-                        # Check the last segment
-                        if (merged_timestamps[-1]['end'] - merged_timestamps[-1]['start']) * 1000 / sampling_rate < min_speech_duration_ms:
-                            merged_timestamps.pop()
-                            
-                        return merged_timestamps
-                    
-                    return []
+                    probs = compute_speech_probs(audio, model, sampling_rate=sampling_rate)
+                    return speech_regions_from_probs(
+                        probs,
+                        sampling_rate=sampling_rate,
+                        threshold=threshold,
+                        min_speech_duration_ms=min_speech_duration_ms,
+                        total_samples=len(audio),
+                        **kwargs
+                    )
                 
                 def read_audio(path, sampling_rate=16000):
                     """Read audio from file"""
@@ -141,7 +204,7 @@ def get_silero_vad_model():
                 
                 def save_audio(path, tensor, sampling_rate=16000):
                     """Save audio tensor to file"""
-                    torchaudio.save(path, tensor.unsqueeze(0), sampling_rate)
+                    torchaudio.save(path, tensor.unsqueeze(0), sampling_rate, bits_per_sample=16)
                 
                 return vad_model, get_speech_timestamps, save_audio, read_audio
             except Exception as e:
@@ -150,52 +213,706 @@ def get_silero_vad_model():
         else:
             raise ValueError("Failed to download silero-vad model")
 
-def ensure_wav_format(file_path):
+def compute_speech_probs(audio, model, sampling_rate=16000, reset_state=True):
     """
-    Convert audio file to WAV format if it's not already in WAV format
-    Returns the path to the WAV file (either the original or converted file)
+    Run the VAD model over the audio frame by frame.
+    Pass reset_state=False to continue from the model state left by the previous
+    call (streaming over consecutive windows of the same recording).
+    Returns a float32 NumPy array with one speech probability per frame.
     """
-    # If the file is already a WAV file, just return the path
-    if file_path.lower().endswith('.wav'):
-        return file_path
+    frame_samples = frame_samples_for(sampling_rate)
+    frame_count = (len(audio) + frame_samples - 1) // frame_samples
+    frames = torch.nn.functional.pad(audio, (0, frame_count * frame_samples - len(audio))).view(frame_count, frame_samples)
     
-    if not FFMPEG_AVAILABLE:
-        logger.warning("FFmpeg not available, cannot convert audio format")
-        return file_path
+    model.eval()
+    if reset_state and hasattr(model, 'reset_states'):
+        model.reset_states()
     
+    probs = np.empty(frame_count, dtype=np.float32)
+    with torch.no_grad():
+        for i in range(frame_count):
+            probs[i] = model(frames[i], sampling_rate).item()
+    return probs
+
+def _write_atomic(path, write):
+    """
+    Call write(temp_path) and move the result to `path` only once it is complete,
+    so readers never see a half-written file. The temporary name is hidden and keeps
+    the extension so encoders can still infer the format from it.
+    """
+    directory, name = os.path.split(path)
+    temp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp{os.path.splitext(name)[1]}")
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return path
+
+def _remove_partial_clips(audio_folder):
+    """Remove temporary files left behind by a worker that died while writing clips"""
+    for name in os.listdir(audio_folder):
+        if name.startswith('.') and '.tmp' in name:
+            try:
+                os.remove(os.path.join(audio_folder, name))
+            except OSError:
+                pass
+
+def clip_format(path):
+    """Storage format of a clip file, derived from its extension"""
+    extension = os.path.splitext(path)[1].lower()
+    for name, (format_extension, _) in CLIP_FORMATS.items():
+        if extension == format_extension:
+            return name
+    return 'wav'
+
+def clip_mimetype(path):
+    """MIME type to serve a clip file with"""
+    return CLIP_FORMATS[clip_format(path)][1]
+
+def clip_variant_path(path, fmt):
+    """Path of the `fmt` copy of a clip (same name, different extension)"""
+    return os.path.splitext(path)[0] + CLIP_FORMATS[fmt][0]
+
+def resolve_clip_path(path):
+    """
+    Locate a clip file on disk.
+    Absolute paths recorded on another host are mapped back to the local clips folder.
+    Returns None if the file cannot be found.
+    """
+    if os.path.exists(path):
+        return path
+    if os.path.isabs(path):
+        # Extract the part after the last directory containing 'clips'
+        parts = path.split('clips')
+        if len(parts) > 1:
+            relative_path = os.path.join('clips', parts[-1].lstrip('/'))
+            if os.path.exists(relative_path):
+                logger.info(f"Using relative path instead: {relative_path}")
+                return relative_path
+    return None
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    """Hex SHA-256 digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def segment_record(path, samples, start, end, sampling_rate, probs=None, virtual=False):
+    """
+    Metadata of a clip cut from the decoded source at samples [start, end).
+    `samples` holds exactly the clip's samples; `probs` the VAD probabilities
+    of the frames it covers, if known. For virtual clips `path` is the source.
+    """
+    samples = np.asarray(samples)
+    if samples.dtype == np.int16:
+        samples = samples.astype(np.float32) / 32768.0
+    return {
+        'path': path,
+        'virtual': virtual,
+        'start_sample': int(start),
+        'end_sample': int(end),
+        'duration': (end - start) / sampling_rate,
+        'sample_rate': sampling_rate,
+        'rms': float(np.sqrt(np.mean(np.square(samples, dtype=np.float64)))) if len(samples) else 0.0,
+        'peak': float(np.max(np.abs(samples))) if len(samples) else 0.0,
+        'speech_prob': float(np.mean(probs)) if probs is not None and len(probs) else None
+    }
+
+def _whole_file_record(path, full_path):
+    """Metadata of a clip that is a WAV copy of the entire source (no segmentation)"""
+    record = {'path': path, 'virtual': False, 'start_sample': 0, 'end_sample': None, 'duration': None,
+              'sample_rate': None, 'rms': None, 'peak': None, 'speech_prob': None}
     try:
-        # Create a temporary directory for the converted file
-        temp_dir = tempfile.mkdtemp()
-        file_name = os.path.basename(file_path)
-        base_name = os.path.splitext(file_name)[0]
-        wav_path = os.path.join(temp_dir, f"{base_name}.wav")
+        with wave.open(full_path) as wav:
+            record.update(end_sample=wav.getnframes(), sample_rate=wav.getframerate(),
+                          duration=wav.getnframes() / wav.getframerate())
+    except (wave.Error, EOFError, OSError) as e:
+        logger.warning(f"Could not read WAV header of {full_path}: {str(e)}")
+    return record
+
+def clip_content_hash(path, span=None, source_hash=None):
+    """
+    SHA-256 identifying a clip's audio: that of its file, or for a virtual clip
+    that of its source (pass `source_hash` if already known) combined with its span.
+    """
+    if span is None:
+        return file_sha256(path)
+    source_hash = source_hash or file_sha256(path)
+    return hashlib.sha256(f"{source_hash}:{span[0]}:{span[1]}".encode('utf-8')).hexdigest()
+
+def _encode_opus(path, samples, sampling_rate):
+    """Encode mono float samples to Ogg/Opus by piping 16-bit PCM into FFmpeg"""
+    pcm = (np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0) * 32767).astype(np.int16)
+    subprocess.run([
+        'ffmpeg',
+        '-nostdin',
+        '-v', 'error',
+        '-f', 's16le',
+        '-ar', str(sampling_rate),
+        '-ac', '1',
+        '-i', '-',
+        '-c:a', 'libopus',
+        '-b:a', CLIP_OPUS_BITRATE,
+        '-application', 'voip',       # Tuned for speech
+        '-f', 'ogg',
+        '-y',
+        path
+    ], input=pcm.tobytes(), check=True, capture_output=True)
+
+def materialize_wav(path, sampling_rate=16000):
+    """
+    Return the clip as 16-bit mono WAV bytes, decoding it if it is stored in a
+    compressed format. Used by exports whose target format requires WAV.
+    FFmpeg cannot fill in the sizes of a WAV header it writes to a pipe, so it
+    decodes to raw PCM and the header is added here.
+    """
+    if clip_format(path) == 'wav':
+        with open(path, 'rb') as f:
+            return f.read()
+    if not ffmpeg_available():
+        raise RuntimeError(f"FFmpeg is required to convert {path} to WAV")
+    result = subprocess.run(_ffmpeg_pcm_command(path, sampling_rate), capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed to convert {path} to WAV: {result.stderr.decode(errors='replace')}")
+    pcm = result.stdout[:len(result.stdout) // 2 * 2]
+    return wav_header(len(pcm) // 2, sampling_rate) + pcm
+
+def materialize_clip_wav(path, span=None):
+    """WAV bytes of a clip: the `span` (start, end) samples of a virtual clip's source, or the clip file"""
+    if span is None:
+        return materialize_wav(path)
+    with VirtualClipFile(path, *span) as f:
+        return f.read()
+
+def open_clip_audio(path, span=None):
+    """Binary file object with the clip's stored bytes (a WAV view of its source for virtual clips)"""
+    if span is None:
+        return open(path, 'rb')
+    return VirtualClipFile(path, *span)
+
+def wav_header(frame_count, sampling_rate, channels=1, sample_width=2):
+    """44-byte header of a PCM WAV file holding `frame_count` frames"""
+    data_size = frame_count * channels * sample_width
+    return struct.pack('<4sI4s4sIHHIIHH4sI',
+                       b'RIFF', 36 + data_size, b'WAVE',
+                       b'fmt ', 16, 1, channels, sampling_rate,
+                       sampling_rate * channels * sample_width, channels * sample_width, sample_width * 8,
+                       b'data', data_size)
+
+class PcmSourceWriter:
+    """
+    Writes the normalized 16-bit mono PCM copy of a recording that virtual clips
+    point into. Samples are appended as they are decoded; the header is filled in
+    and the file moved into place on close, so readers never see a partial source.
+    """
+    
+    def __init__(self, path, sampling_rate=16000):
+        self.path = path
+        self.sampling_rate = sampling_rate
+        self.frame_count = 0
+        directory, name = os.path.split(path)
+        self._temp_path = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp.wav")
+        self._file = open(self._temp_path, 'wb')
+        self._file.write(wav_header(0, sampling_rate))
+    
+    def write(self, samples):
+        """Append float samples in [-1, 1]"""
+        samples = np.asarray(samples, dtype=np.float32)
+        pcm = np.clip(np.round(samples * 32768.0), -32768, 32767).astype('<i2')
+        self._file.write(pcm.tobytes())
+        self.frame_count += len(pcm)
+    
+    def close(self):
+        self._file.seek(0)
+        self._file.write(wav_header(self.frame_count, self.sampling_rate))
+        self._file.close()
+        os.replace(self._temp_path, self.path)
+    
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+class VirtualClipFile(io.RawIOBase):
+    """
+    Read-only, seekable view of samples [start, end) of a PCM WAV source as a
+    standalone WAV file: a synthesized header followed by the samples, which are
+    copied straight out of a read-only memory map of the source.
+    """
+    
+    def __init__(self, path, start_sample, end_sample):
+        super().__init__()
+        with wave.open(path, 'rb') as source:
+            sampling_rate, channels, sample_width = source.getframerate(), source.getnchannels(), source.getsampwidth()
+            frame_count = source.getnframes()
+        frame_size = channels * sample_width
+        # The data chunk is the last chunk of the sources written by PcmSourceWriter
+        data_offset = os.path.getsize(path) - frame_count * frame_size
+        start_sample = max(0, min(start_sample, frame_count))
+        end_sample = max(start_sample, min(end_sample, frame_count))
         
-        # Use FFmpeg to convert the file to WAV format
-        logger.info(f"Converting {file_path} to WAV format")
-        subprocess.run([
-            'ffmpeg', 
-            '-i', file_path, 
-            '-acodec', 'pcm_s16le',  # Linear PCM format, 16-bit depth
-            '-ar', '44100',          # 44.1kHz sample rate
-            '-ac', '1',              # Mono channel
-            '-y',                    # Overwrite output file if it exists
-            wav_path
-        ], check=True, capture_output=True)
+        self._header = wav_header(end_sample - start_sample, sampling_rate, channels, sample_width)
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = memoryview(self._map)[data_offset + start_sample * frame_size:data_offset + end_sample * frame_size]
+        self.size = len(self._header) + len(self._data)
+        self._position = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self._position = max(0, offset)
+        return self._position
+    
+    def tell(self):
+        return self._position
+    
+    def readinto(self, buffer):
+        buffer = memoryview(buffer).cast('B')
+        written = 0
+        header_size = len(self._header)
+        if self._position < header_size:
+            part = self._header[self._position:self._position + len(buffer)]
+            buffer[:len(part)] = part
+            written = len(part)
+        data_position = self._position + written - header_size
+        if written < len(buffer) and data_position < len(self._data):
+            part = self._data[data_position:data_position + len(buffer) - written]
+            buffer[written:written + len(part)] = part
+            written += len(part)
+        self._position += written
+        return written
+    
+    def close(self):
+        if not self.closed:
+            self._data.release()
+            self._map.close()
+            self._file.close()
+        super().close()
+
+class ClipWriter:
+    """
+    Encodes and writes clips on a bounded thread pool.
+    
+    torchaudio's encoders release the GIL, so clips are written in parallel with each
+    other and with VAD inference. At most 2 * max_workers clips are queued at any time,
+    which bounds the memory held by pending writes. Each clip is written atomically, in
+    the format given by its file extension plus one copy per CLIP_PLAYBACK_FORMATS entry.
+    """
+    
+    def __init__(self, save_audio, sampling_rate=16000, max_workers=None):
+        self.save_audio = save_audio
+        self.sampling_rate = sampling_rate
+        max_workers = max_workers or CLIP_WRITE_WORKERS
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='clip-writer')
+        self._slots = threading.BoundedSemaphore(max_workers * 2)
+        self._futures = []
+    
+    def submit(self, path, samples):
+        """Queue a clip for writing; blocks while the queue is full"""
+        self._slots.acquire()
+        future = self._executor.submit(self._write, path, samples)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+    
+    def _write(self, path, samples):
+        for fmt in [clip_format(path)] + CLIP_PLAYBACK_FORMATS:
+            variant_path = clip_variant_path(path, fmt)
+            if fmt == 'opus':
+                _write_atomic(variant_path, lambda temp_path: _encode_opus(temp_path, samples, self.sampling_rate))
+            else:
+                _write_atomic(variant_path, lambda temp_path: self.save_audio(temp_path, samples, sampling_rate=self.sampling_rate))
+    
+    def close(self):
+        """Wait for all queued clips and re-raise the first write error"""
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._executor.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for future in self._futures:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+        return False
+
+def _ffmpeg_pcm_command(file_path, sampling_rate):
+    """FFmpeg command that decodes any input to raw 16-bit mono PCM on stdout"""
+    return [
+        'ffmpeg',
+        '-nostdin',
+        '-v', 'error',
+        '-i', file_path,
+        '-f', 's16le',               # Raw 16-bit PCM on stdout
+        '-acodec', 'pcm_s16le',
+        '-ac', '1',                  # Mono channel
+        '-ar', str(sampling_rate),   # Resampled once, straight to the VAD rate
+        '-'
+    ]
+
+def iter_audio_windows(file_path, sampling_rate=16000, window_samples=16000 * 30):
+    """
+    Decode an audio file of any format through an FFmpeg pipe, yielding mono
+    float32 windows of `window_samples` samples (the last one may be shorter).
+    Only one window is held in memory at a time.
+    """
+    process = subprocess.Popen(_ffmpeg_pcm_command(file_path, sampling_rate), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    
+    try:
+        while True:
+            data = process.stdout.read(window_samples * 2)
+            if not data:
+                break
+            yield np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768.0
         
-        logger.info(f"Converted to WAV: {wav_path}")
-        return wav_path
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Error converting to WAV: {e.stderr.decode() if e.stderr else str(e)}")
-        return file_path
-    except Exception as e:
-        logger.error(f"Unexpected error in ensure_wav_format: {str(e)}")
-        return file_path
+        process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(f"FFmpeg failed to decode {file_path}: {process.stderr.read().decode(errors='replace')}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+def _should_stream(file_path):
+    """Decide whether a file is segmented in streaming (bounded-memory) mode"""
+    if not ffmpeg_available() or STREAMING_MODE == 'never':
+        return False
+    if STREAMING_MODE == 'always':
+        return True
+    return os.path.getsize(file_path) >= STREAMING_MIN_BYTES
+
+def _segment_streaming(file_path, vad_model, clip_writer, audio_folder, audio_folder_name,
+                       sampling_rate=16000, timings=None, source_writer=None, vad_params=None, prob_track=None):
+    """
+    Segment a recording window by window and write each clip as soon as it closes.
+    
+    Only the current decode window plus the samples of segments that are still open
+    (or may still be merged with the next one) are kept in memory, so peak memory does
+    not grow with the length of the recording. Returns the segment records of the clips.
+    
+    With a `source_writer` (virtual clips) every window is appended to the
+    normalized source instead, and no clip files are written. The probabilities
+    of every window are appended to `prob_track` if given.
+    """
+    timings = timings if timings is not None else {}
+    params = {**DEFAULT_VAD_PARAMS, **(vad_params or {})}
+    frame_samples = frame_samples_for(sampling_rate)
+    window_frames = -(-STREAMING_WINDOW_SECONDS * sampling_rate // frame_samples)
+    pad_samples = int(sampling_rate * params['speech_pad_ms'] / 1000)
+    tracker = StreamingRegionTracker(sampling_rate=sampling_rate, **params)
+    
+    buffer = np.zeros(0, dtype=np.float32)
+    buffer_offset = 0  # Position of buffer[0] in the recording, in samples
+    prob_buffer = np.zeros(0, dtype=np.float32)
+    prob_offset = 0  # Frame index of prob_buffer[0]
+    previous_end = 0
+    records = []
+    source_path = os.path.join('clips', audio_folder_name, SOURCE_PCM_FILENAME)
+    
+    def write_clips(regions):
+        nonlocal previous_end
+        start_time = time.perf_counter()
+        for start_frame, end_frame in regions:
+            start = max(start_frame * frame_samples - pad_samples, previous_end, buffer_offset)
+            end = min(end_frame * frame_samples + pad_samples, buffer_offset + len(buffer))
+            
+            clip_filename = f"clip_{len(records) + 1}{CLIP_FORMATS[CLIP_STORAGE_FORMAT][0]}"
+            full_clip_path = os.path.join(audio_folder, clip_filename)
+            samples = buffer[start - buffer_offset:end - buffer_offset]
+            probs = prob_buffer[start // frame_samples - prob_offset:-(-end // frame_samples) - prob_offset]
+            if source_writer is not None:
+                records.append(segment_record(source_path, samples, start, end, sampling_rate, probs, virtual=True))
+            else:
+                clip_writer.submit(full_clip_path, torch.from_numpy(samples.copy()))
+                records.append(segment_record(os.path.join('clips', audio_folder_name, clip_filename),
+                                              samples, start, end, sampling_rate, probs))
+            previous_end = end
+        timings['clip_write'] = timings.get('clip_write', 0) + time.perf_counter() - start_time
+    
+    windows = iter_audio_windows(file_path, sampling_rate, window_frames * frame_samples)
+    first_window = True
+    while True:
+        start_time = time.perf_counter()
+        window = next(windows, None)
+        timings['decode'] = timings.get('decode', 0) + time.perf_counter() - start_time
+        if window is None:
+            break
+        
+        buffer = np.concatenate((buffer, window))
+        if source_writer is not None:
+            # Counted as clip writing, like the source written by the batch path
+            start_time = time.perf_counter()
+            source_writer.write(window)
+            timings['clip_write'] = timings.get('clip_write', 0) + time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        probs = compute_speech_probs(torch.from_numpy(window), vad_model, sampling_rate, reset_state=first_window)
+        timings['vad_inference'] = timings.get('vad_inference', 0) + time.perf_counter() - start_time
+        first_window = False
+        prob_buffer = np.concatenate((prob_buffer, probs))
+        if prob_track is not None:
+            prob_track.append(probs)
+        
+        start_time = time.perf_counter()
+        regions = tracker.push(probs)
+        timings['segmentation'] = timings.get('segmentation', 0) + time.perf_counter() - start_time
+        write_clips(regions)
+        
+        # Drop samples that no unfinished segment can reach anymore
+        keep_from = max(tracker.earliest_active_frame() * frame_samples - pad_samples, buffer_offset)
+        buffer = buffer[keep_from - buffer_offset:]
+        buffer_offset = keep_from
+        prob_buffer = prob_buffer[keep_from // frame_samples - prob_offset:]
+        prob_offset = keep_from // frame_samples
+    
+    start_time = time.perf_counter()
+    regions = tracker.finish()
+    timings['segmentation'] = timings.get('segmentation', 0) + time.perf_counter() - start_time
+    write_clips(regions)
+    return records
+
+def decode_audio(file_path, sampling_rate=16000):
+    """
+    Decode an audio file of any format straight to a mono float32 tensor at
+    `sampling_rate`. FFmpeg resamples and writes raw PCM to a pipe, so no
+    intermediate file is written and the audio is only resampled once.
+    """
+    result = subprocess.run(_ffmpeg_pcm_command(file_path, sampling_rate), capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed to decode {file_path}: {result.stderr.decode(errors='replace')}")
+    
+    samples = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+    return torch.from_numpy(samples)
+
+def transcode_to_wav(file_path, wav_path, sampling_rate=16000):
+    """
+    Write a 16-bit mono WAV copy of an audio file to `wav_path`.
+    Files that are already WAV (or any file when FFmpeg is missing) are copied as is.
+    """
+    if file_path.lower().endswith('.wav') or not ffmpeg_available():
+        if not ffmpeg_available() and not file_path.lower().endswith('.wav'):
+            logger.warning("FFmpeg not available, cannot convert audio format")
+        return _write_atomic(wav_path, lambda temp_path: shutil.copy(file_path, temp_path))
+    
+    logger.info(f"Converting {file_path} to WAV format")
+    return _write_atomic(wav_path, lambda temp_path: subprocess.run([
+        'ffmpeg',
+        '-nostdin',
+        '-i', file_path,
+        '-acodec', 'pcm_s16le',      # Linear PCM format, 16-bit depth
+        '-ar', str(sampling_rate),
+        '-ac', '1',                  # Mono channel
+        '-y',                        # Overwrite output file if it exists
+        temp_path
+    ], check=True, capture_output=True))
+
+def _save_segments(audio, samples, probs, timestamps, audio_folder, audio_folder_name, save_audio,
+                   virtual=False, write_source=True):
+    """
+    Store the segments `timestamps` cut from an in-memory recording and return
+    their records. Clip files are written from the `audio` tensor; virtual clips
+    only need the normalized source, written from `samples` unless it already exists.
+    """
+    frame_samples = frame_samples_for(16000)
+    records = []
+    
+    def clip_probs(ts):
+        return probs[ts['start'] // frame_samples:-(-ts['end'] // frame_samples)]
+    
+    if virtual:
+        if write_source:
+            with PcmSourceWriter(os.path.join(audio_folder, SOURCE_PCM_FILENAME), sampling_rate=16000) as source_writer:
+                source_writer.write(samples)
+        relative_source_path = os.path.join('clips', audio_folder_name, SOURCE_PCM_FILENAME)
+        for ts in timestamps:
+            records.append(segment_record(relative_source_path, samples[ts['start']:ts['end']],
+                                          ts['start'], ts['end'], 16000, clip_probs(ts), virtual=True))
+        return records
+    
+    with ClipWriter(save_audio, sampling_rate=16000) as clip_writer:
+        for i, ts in enumerate(timestamps):
+            clip_filename = f"clip_{i+1}{CLIP_FORMATS[CLIP_STORAGE_FORMAT][0]}"
+            full_clip_path = os.path.join(audio_folder, clip_filename)
+            clip_writer.submit(full_clip_path, audio[ts['start']:ts['end']])
+            
+            # Store relative path in the database
+            relative_clip_path = os.path.join('clips', audio_folder_name, clip_filename)
+            records.append(segment_record(relative_clip_path, samples[ts['start']:ts['end']],
+                                          ts['start'], ts['end'], 16000, clip_probs(ts)))
+    _remove_stale_clip_files(audio_folder, len(records))
+    return records
 
-def process_audio_file(file_path, audio_id, output_folder):
+def _remove_stale_clip_files(audio_folder, clip_count):
+    """Remove clip files numbered beyond clip_count, left over from an earlier segmentation"""
+    for name in os.listdir(audio_folder):
+        match = re.match(r'clip_(\d+)\.', name)
+        if match and int(match.group(1)) > clip_count:
+            try:
+                os.remove(os.path.join(audio_folder, name))
+            except OSError:
+                pass
+
+def _source_samples(path):
+    """16-bit samples of a normalized source WAV, memory-mapped"""
+    with wave.open(path, 'rb') as source:
+        frame_count = source.getnframes()
+    return np.memmap(path, dtype='<i2', mode='r', offset=os.path.getsize(path) - frame_count * 2, shape=(frame_count,))
+
+def save_speech_probs(path, probs):
+    """Cache a per-frame speech probability track as a float16 .npy file"""
+    _write_atomic(path, lambda temp_path: np.save(temp_path, np.asarray(probs, dtype=np.float16)))
+
+def load_speech_probs(path):
+    """Memory-map a cached speech probability track"""
+    return np.load(path, mmap_mode='r')
+
+def _cut_segments_streaming(file_path, probs, timestamps, audio_folder, audio_folder_name, clip_writer=None,
+                            source_writer=None, sampling_rate=16000, timings=None):
+    """
+    Cut already known segments from a recording decoded window by window.
+    Only the samples from the start of the next segment on are kept, so memory
+    does not grow with the length of the recording. Clips go to `clip_writer`;
+    with a `source_writer` (virtual clips) the windows are appended to the
+    normalized source instead. Returns the segment records.
+    """
+    timings = timings if timings is not None else {}
+    frame_samples = frame_samples_for(sampling_rate)
+    source_path = os.path.join('clips', audio_folder_name, SOURCE_PCM_FILENAME)
+    buffer = np.zeros(0, dtype=np.float32)
+    buffer_offset = 0  # Position of buffer[0] in the recording, in samples
+    records = []
+    
+    def write_clip(ts):
+        start_time = time.perf_counter()
+        # The probability track is rounded up to whole frames, so the last segment may end past the audio
+        start, end = ts['start'], min(ts['end'], buffer_offset + len(buffer))
+        samples = buffer[start - buffer_offset:end - buffer_offset]
+        probs_slice = probs[start // frame_samples:-(-end // frame_samples)]
+        if source_writer is not None:
+            records.append(segment_record(source_path, samples, start, end, sampling_rate, probs_slice, virtual=True))
+        else:
+            clip_filename = f"clip_{len(records) + 1}{CLIP_FORMATS[CLIP_STORAGE_FORMAT][0]}"
+            clip_writer.submit(os.path.join(audio_folder, clip_filename), torch.from_numpy(samples.copy()))
+            records.append(segment_record(os.path.join('clips', audio_folder_name, clip_filename),
+                                          samples, start, end, sampling_rate, probs_slice))
+        timings['clip_write'] = timings.get('clip_write', 0) + time.perf_counter() - start_time
+    
+    windows = iter_audio_windows(file_path, sampling_rate, STREAMING_WINDOW_SECONDS * sampling_rate)
+    while True:
+        start_time = time.perf_counter()
+        window = next(windows, None)
+        timings['decode'] = timings.get('decode', 0) + time.perf_counter() - start_time
+        if window is None:
+            break
+        
+        buffer = np.concatenate((buffer, window))
+        if source_writer is not None:
+            source_writer.write(window)
+        while len(records) < len(timestamps) and timestamps[len(records)]['end'] <= buffer_offset + len(buffer):
+            write_clip(timestamps[len(records)])
+        
+        # Drop samples before the next segment
+        keep_from = timestamps[len(records)]['start'] if len(records) < len(timestamps) else buffer_offset + len(buffer)
+        keep_from = min(max(keep_from, buffer_offset), buffer_offset + len(buffer))
+        buffer = buffer[keep_from - buffer_offset:]
+        buffer_offset = keep_from
+    
+    while len(records) < len(timestamps):
+        write_clip(timestamps[len(records)])
+    return records
+
+def _resegment(file_path, audio_folder, audio_folder_name, probs_path, params, timings):
     """
-    Process an audio file using silero-vad to extract speech segments
+    Cut new segments from the cached probability track instead of running the model.
+    Virtual clips are cut from the existing normalized source without decoding;
+    otherwise the recording is decoded window by window and only the samples of
+    the segment being cut are kept in memory.
+    """
+    probs = load_speech_probs(probs_path)
+    source_path = os.path.join(audio_folder, SOURCE_PCM_FILENAME)
+    virtual = CLIP_STORAGE_MODE == 'virtual'
+    
+    if virtual and os.path.exists(source_path):
+        samples = _source_samples(source_path)
+        start_time = time.perf_counter()
+        timestamps = speech_regions_from_probs(probs, sampling_rate=16000, total_samples=len(samples), **params)
+        timings['segmentation'] = time.perf_counter() - start_time
+        
+        start_time = time.perf_counter()
+        records = _save_segments(None, samples, probs, timestamps, audio_folder, audio_folder_name, None,
+                                 virtual=True, write_source=False)
+        timings['clip_write'] = time.perf_counter() - start_time
+        return records
+    
+    # Without the decoded length, the probability track bounds the last segment
+    start_time = time.perf_counter()
+    timestamps = speech_regions_from_probs(probs, sampling_rate=16000, **params)
+    timings['segmentation'] = time.perf_counter() - start_time
+    
+    if virtual:
+        with PcmSourceWriter(source_path, sampling_rate=16000) as source_writer:
+            return _cut_segments_streaming(file_path, probs, timestamps, audio_folder, audio_folder_name,
+                                           source_writer=source_writer, timings=timings)
+    
+    with ClipWriter(get_silero_vad_model()[2], sampling_rate=16000) as clip_writer:
+        records = _cut_segments_streaming(file_path, probs, timestamps, audio_folder, audio_folder_name,
+                                          clip_writer=clip_writer, timings=timings)
+    _remove_stale_clip_files(audio_folder, len(records))
+    return records
+
+def _report_timings(audio_id, timings):
+    """Log the per-stage timings of a recording and record them as metrics"""
+    logger.info(f"Audio {audio_id} timings: " + ", ".join(f"{name}={value:.2f}s" for name, value in timings.items()))
+    for name, value in timings.items():
+        SEGMENTATION_STAGE_SECONDS.observe(value, stage=name)
+
+
+def process_audio_file(file_path, audio_id, output_folder, vad_params=None, reuse_probs=False):
+    """
+    Process an audio file using silero-vad to extract speech segments.
+    
+    Returns one record per clip, in order: the clip's relative path, its
+    start/end offsets in the source (in samples at `sample_rate`), duration
+    in seconds, RMS and peak level (linear, 0-1) and mean speech probability.
+    Fields that cannot be measured (e.g. when torch is missing) are None.
+    With CLIP_STORAGE_MODE=virtual no clip files are written: 'virtual' is True
+    and 'path' is the normalized source the offsets point into.
+    
+    `vad_params` overrides entries of DEFAULT_VAD_PARAMS. The speech probability
+    track is cached next to the clips (VAD_PROBS_FILENAME); with reuse_probs it
+    is segmented again instead of running the model.
     """
     logger.info(f"Processing audio file: {file_path}")
+    params = {**DEFAULT_VAD_PARAMS, **(vad_params or {})}
     
     # Make sure output folder exists
     os.makedirs(output_folder, exist_ok=True)
@@ -204,76 +921,93 @@ def process_audio_file(file_path, audio_id, output_folder):
     audio_folder_name = f"audio_{audio_id}"
     audio_folder = os.path.join(output_folder, audio_folder_name)
     os.makedirs(audio_folder, exist_ok=True)
+    _remove_partial_clips(audio_folder)
+    probs_path = os.path.join(audio_folder, VAD_PROBS_FILENAME)
     
-    # Convert to WAV format if needed
-    wav_file_path = ensure_wav_format(file_path)
+    streaming = torch_available() and _should_stream(file_path)
     
     try:
-        if not TORCH_AVAILABLE:
+        timings = {}
+        if reuse_probs and os.path.exists(probs_path):
+            logger.info(f"Re-segmenting from the cached speech probabilities with {params}")
+            records = _resegment(file_path, audio_folder, audio_folder_name, probs_path, params, timings)
+            logger.info(f"Re-segmentation complete. {len(records)} clips.")
+            _report_timings(audio_id, timings)
+            return records
+        
+        if not torch_available():
             # If torch is not available, just create a single clip as a copy of the original file
             logger.warning("Torch not available, creating single clip from entire file")
             clip_filename = "clip_1.wav"
             full_clip_path = os.path.join(audio_folder, clip_filename)
-            shutil.copy(wav_file_path, full_clip_path)
+            transcode_to_wav(file_path, full_clip_path)
             
             # Return relative path for database storage
             relative_clip_path = os.path.join('clips', audio_folder_name, clip_filename)
-            return [relative_clip_path]
+            return [_whole_file_record(relative_clip_path, full_clip_path)]
         
-        # Load the Silero VAD model
-        vad_model, get_speech_timestamps, save_audio, read_audio = get_silero_vad_model()
+        # Load the Silero VAD model (cached after the first call in this process)
+        start_time = time.perf_counter()
+        vad_model, _, save_audio, read_audio = get_silero_vad_model()
+        timings['model_load'] = time.perf_counter() - start_time
         
-        # Load the audio file
-        audio = read_audio(wav_file_path, sampling_rate=16000)
+        virtual = CLIP_STORAGE_MODE == 'virtual'
+        source_path = os.path.join(audio_folder, SOURCE_PCM_FILENAME)
+        prob_track = []
         
-        # Get speech timestamps
-        logger.info("Detecting speech segments...")
-        timestamps = get_speech_timestamps(audio, vad_model, sampling_rate=16000)
+        if streaming and virtual:
+            logger.info("Detecting speech segments in streaming mode (virtual clips)...")
+            with PcmSourceWriter(source_path, sampling_rate=16000) as source_writer:
+                records = _segment_streaming(file_path, vad_model, None, audio_folder, audio_folder_name,
+                                             sampling_rate=16000, timings=timings, source_writer=source_writer,
+                                             vad_params=params, prob_track=prob_track)
+            save_speech_probs(probs_path, np.concatenate(prob_track) if prob_track else np.zeros(0))
+        elif streaming:
+            logger.info("Detecting and saving speech segments in streaming mode...")
+            with ClipWriter(save_audio, sampling_rate=16000) as clip_writer:
+                records = _segment_streaming(file_path, vad_model, clip_writer, audio_folder, audio_folder_name,
+                                             sampling_rate=16000, timings=timings,
+                                             vad_params=params, prob_track=prob_track)
+                # Leaving the block waits for the clips still being written
+                start_time = time.perf_counter()
+            timings['clip_write'] = timings.get('clip_write', 0) + time.perf_counter() - start_time
+            save_speech_probs(probs_path, np.concatenate(prob_track) if prob_track else np.zeros(0))
+            _remove_stale_clip_files(audio_folder, len(records))
+        else:
+            # Load the audio file
+            start_time = time.perf_counter()
+            if ffmpeg_available():
+                audio = decode_audio(file_path, sampling_rate=16000)
+            else:
+                audio = read_audio(file_path, sampling_rate=16000)
+            timings['decode'] = time.perf_counter() - start_time
         
-        # Save each speech segment as a separate clip
-        logger.info(f"Saving {len(timestamps)} speech segments...")
-        clip_paths = []
+            # Score every frame, then cut regions the same way the streaming mode does,
+            # keeping the probabilities for the clips' speech_prob and later re-segmentation
+            logger.info("Detecting speech segments...")
+            start_time = time.perf_counter()
+            probs = compute_speech_probs(audio, vad_model, sampling_rate=16000)
+            timings['vad_inference'] = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            timestamps = speech_regions_from_probs(probs, sampling_rate=16000, total_samples=len(audio), **params)
+            timings['segmentation'] = time.perf_counter() - start_time
+            save_speech_probs(probs_path, probs)
         
-        for i, ts in enumerate(timestamps):
-            clip_filename = f"clip_{i+1}.wav"
-            full_clip_path = os.path.join(audio_folder, clip_filename)
-            save_audio(full_clip_path, audio[ts['start']:ts['end']], sampling_rate=16000)
-            
-            # Store relative path in the database
-            relative_clip_path = os.path.join('clips', audio_folder_name, clip_filename)
-            clip_paths.append(relative_clip_path)
+            # Save each speech segment as a separate clip, or (virtual clips) only
+            # the normalized source with the segments as sample ranges of it
+            logger.info(f"Saving {len(timestamps)} speech segments...")
+            start_time = time.perf_counter()
+            records = _save_segments(audio, audio.numpy(), probs, timestamps, audio_folder, audio_folder_name,
+                                     save_audio, virtual=virtual)
+            timings['clip_write'] = time.perf_counter() - start_time
         
-        logger.info(f"Audio processing complete. {len(clip_paths)} clips saved.")
+        logger.info(f"Audio processing complete. {len(records)} clips saved.")
+        _report_timings(audio_id, timings)
         
-        # Clean up temporary WAV file if it was created
-        if wav_file_path != file_path and os.path.exists(wav_file_path):
-            try:
-                os.remove(wav_file_path)
-            except Exception as e:
-                logger.warning(f"Failed to clean up temporary WAV file: {str(e)}")
-                
-        return clip_paths
+        return records
         
     except Exception as e:
+        # Let the job queue retry the recording and mark it 'error' when attempts run out;
+        # a fallback clip would hide the failure and replace existing clips
         logger.error(f"Error processing audio: {str(e)}")
-        # As a fallback on error, create a dummy clip (in production this should handle differently)
-        try:
-            clip_filename = "clip_error_fallback.wav"
-            full_clip_path = os.path.join(audio_folder, clip_filename)
-            shutil.copy(wav_file_path, full_clip_path)
-            logger.warning(f"Created fallback clip due to processing error: {full_clip_path}")
-            
-            # Return relative path for database storage
-            relative_clip_path = os.path.join('clips', audio_folder_name, clip_filename)
-            
-            # Clean up temporary WAV file if it was created
-            if wav_file_path != file_path and os.path.exists(wav_file_path):
-                try:
-                    os.remove(wav_file_path)
-                except Exception as clean_error:
-                    logger.warning(f"Failed to clean up temporary WAV file: {str(clean_error)}")
-                    
-            return [relative_clip_path]
-        except Exception as copy_error:
-            logger.error(f"Error creating fallback clip: {str(copy_error)}")
-            raise e
+        raise
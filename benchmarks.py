@@ -0,0 +1,434 @@
+#!/usr/bin/env python
+"""
+Micro-benchmarks for the hot paths of the platform.
+
+Usage:
+    python benchmarks.py vad-regions [--hours 1]
+    python benchmarks.py storage [--clips-dir clips]
+    python benchmarks.py indexes [--clips 1000000] [--database-url sqlite:///bench.sqlite]
+    python benchmarks.py assignment [--clips 10000]
+    python benchmarks.py startup [--runs 5]
+"""
+
+import os
+import sys
+import glob
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+
+def _timeit(func, repeat=3):
+    """Best wall-clock time of `repeat` runs, plus the last result"""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def synthetic_speech_probs(frame_count, seed=0):
+    """
+    Probability track that alternates between speech and silence runs
+    of random length, with noise on top (roughly what Silero produces).
+    """
+    rng = np.random.default_rng(seed)
+    run_lengths = rng.integers(5, 200, size=frame_count // 5 + 1)
+    levels = np.resize([0.9, 0.1], len(run_lengths))
+    probs = np.repeat(levels, run_lengths)[:frame_count]
+    probs = probs + rng.normal(0, 0.15, size=len(probs))
+    return np.clip(probs, 0, 1).astype(np.float32)
+
+
+def legacy_speech_regions(probs, threshold=0.5, min_speech_duration_ms=250, frame_ms=32):
+    """The element-by-element loop the fallback VAD used before vectorization"""
+    try:
+        import torch
+        # The original loop iterated over tensor elements, which is slower still
+        mask = (torch.from_numpy(probs) > threshold).int()
+    except ImportError:
+        mask = (probs > threshold).astype(int)
+
+    starts = []
+    ends = []
+    in_speech = False
+    for j, val in enumerate(mask):
+        if val == 1 and not in_speech:
+            starts.append(j)
+            in_speech = True
+        elif val == 0 and in_speech:
+            ends.append(j)
+            in_speech = False
+    if in_speech:
+        ends.append(len(mask))
+
+    speech_timestamps = [{'start': s, 'end': e} for s, e in zip(starts, ends)]
+    if not speech_timestamps:
+        return []
+
+    merged_timestamps = [speech_timestamps[0]]
+    for ts in speech_timestamps[1:]:
+        last_end = merged_timestamps[-1]['end']
+        if ts['start'] <= last_end:
+            merged_timestamps[-1]['end'] = max(last_end, ts['end'])
+        elif (merged_timestamps[-1]['end'] - merged_timestamps[-1]['start']) * frame_ms >= min_speech_duration_ms:
+            merged_timestamps.append(ts)
+    if (merged_timestamps[-1]['end'] - merged_timestamps[-1]['start']) * frame_ms < min_speech_duration_ms:
+        merged_timestamps.pop()
+    return merged_timestamps
+
+
+def bench_vad_regions(args):
+    from segmentation import speech_regions_from_probs, frame_samples_for
+
+    sampling_rate = 16000
+    frame_samples = frame_samples_for(sampling_rate)
+    frame_count = int(args.hours * 3600 * sampling_rate / frame_samples)
+    probs = synthetic_speech_probs(frame_count)
+    print(f"Synthetic probability track: {args.hours:g}h of audio, {frame_count} frames")
+
+    legacy_time, legacy = _timeit(lambda: legacy_speech_regions(probs), repeat=args.repeat)
+    vector_time, vector = _timeit(
+        lambda: speech_regions_from_probs(probs, sampling_rate=sampling_rate, total_samples=frame_count * frame_samples),
+        repeat=args.repeat
+    )
+
+    print(f"  legacy Python loop : {legacy_time * 1000:9.1f} ms  ({len(legacy)} segments, no hysteresis)")
+    print(f"  vectorized         : {vector_time * 1000:9.1f} ms  ({len(vector)} segments, hysteresis)")
+    print(f"  speed-up           : {legacy_time / vector_time:9.1f}x")
+
+
+def bench_storage(args):
+    """Disk and transfer size of a clip corpus stored as WAV vs FLAC vs Opus"""
+    import wave
+    import subprocess
+    import audio_processor
+
+    wav_paths = sorted(glob.glob(os.path.join(args.clips_dir, '**', '*.wav'), recursive=True))
+    if not wav_paths:
+        print(f"No WAV clips found under {args.clips_dir}")
+        return
+    print(f"Sample corpus: {len(wav_paths)} WAV clips under {args.clips_dir}")
+
+    totals = {'wav': 0, 'flac': 0, 'opus': 0}
+    durations = 0.0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for i, wav_path in enumerate(wav_paths):
+            with wave.open(wav_path) as wav_file:
+                sampling_rate = wav_file.getframerate()
+                pcm = np.frombuffer(wav_file.readframes(wav_file.getnframes()), dtype=np.int16)
+            samples = pcm.astype(np.float32) / 32768.0
+            durations += len(samples) / sampling_rate
+            totals['wav'] += os.path.getsize(wav_path)
+
+            flac_path = os.path.join(temp_dir, f"{i}.flac")
+            subprocess.run(['ffmpeg', '-nostdin', '-v', 'error', '-i', wav_path, '-c:a', 'flac', flac_path], check=True)
+            totals['flac'] += os.path.getsize(flac_path)
+
+            opus_path = os.path.join(temp_dir, f"{i}.opus")
+            audio_processor._encode_opus(opus_path, samples, sampling_rate)
+            totals['opus'] += os.path.getsize(opus_path)
+
+    print(f"  audio duration : {durations / 60:.1f} min")
+    for fmt, size in totals.items():
+        print(f"  {fmt:5s}          : {size / 1024 / 1024:8.2f} MiB  "
+              f"({size / totals['wav'] * 100:5.1f}% of WAV, {size * 8 / durations / 1000:6.1f} kbit/s)")
+
+# Lookups issued by the hot pages, as (name, SQL) pairs
+INDEX_BENCH_QUERIES = [
+    ('review page', """
+        SELECT clip.id, clip."order", transcription.text, "user".username
+        FROM clip
+        LEFT OUTER JOIN transcription ON transcription.clip_id = clip.id
+        LEFT OUTER JOIN "user" ON "user".id = clip.transcriber_id
+        WHERE clip.audio_id = :audio_id
+        ORDER BY clip."order" LIMIT 50"""),
+    ('transcriber dashboard', """
+        SELECT clip.audio_id, count(clip.id), count(transcription.id)
+        FROM clip LEFT OUTER JOIN transcription ON transcription.clip_id = clip.id
+        WHERE clip.transcriber_id = :transcriber_id
+        GROUP BY clip.audio_id"""),
+    ('transcribe page', """
+        SELECT clip.id FROM clip
+        WHERE clip.audio_id = :audio_id AND clip.transcriber_id = :transcriber_id
+        ORDER BY clip."order" LIMIT 100"""),
+    ('transcription by clip', """
+        SELECT id, status FROM transcription WHERE clip_id = :clip_id"""),
+    ('unassigned clips', """
+        SELECT id FROM clip WHERE audio_id = :audio_id AND status = 'unassigned'"""),
+    ('review queue size', """
+        SELECT count(*) FROM transcription WHERE status = 'submitted'"""),
+    ('audio list', """
+        SELECT id, filename FROM audio ORDER BY upload_date DESC LIMIT 25"""),
+]
+
+
+def _seed_clips(conn, tables, clip_count, clips_per_audio=1000, transcribers=50, batch_size=50000):
+    """Bulk-load users, audio files, clips and transcriptions with realistic status mixes"""
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+
+    rng = np.random.default_rng(0)
+    audio_count = max(clip_count // clips_per_audio, 1)
+    now = datetime.now()
+
+    conn.execute(insert(tables['user']), [
+        {'id': i, 'username': f'bench{i}', 'email': f'bench{i}@example.com',
+         'password_hash': '-', 'role': 'admin' if i == 1 else 'transcriber'}
+        for i in range(1, transcribers + 2)
+    ])
+    conn.execute(insert(tables['audio']), [
+        {'id': i, 'filename': f'bench_{i}.wav', 'original_path': '-', 'status': 'processed',
+         'uploader_id': 1, 'clip_count': clips_per_audio, 'upload_date': now - timedelta(minutes=i)}
+        for i in range(1, audio_count + 1)
+    ])
+
+    statuses = np.array(['unassigned', 'assigned', 'submitted', 'completed'])
+    transcription_statuses = {'assigned': 'draft', 'submitted': 'submitted', 'completed': 'approved'}
+    for first in range(0, clip_count, batch_size):
+        ids = np.arange(first + 1, min(first + batch_size, clip_count) + 1)
+        audio_ids = (ids - 1) // clips_per_audio + 1
+        # Each audio goes to one transcriber; about 30% of its clips are still unassigned
+        clip_status = statuses[rng.choice(4, size=len(ids), p=[0.3, 0.3, 0.1, 0.3])]
+        transcriber_ids = np.where(clip_status == 'unassigned', 0, audio_ids % transcribers + 2)
+
+        conn.execute(insert(tables['clip']), [
+            {'id': int(i), 'audio_id': int(a), 'filename': f'clip_{o}.wav', 'path': '-',
+             'order': int(o), 'status': str(st), 'transcriber_id': int(t) or None}
+            for i, a, o, st, t in zip(ids, audio_ids, (ids - 1) % clips_per_audio + 1, clip_status, transcriber_ids)
+        ])
+        conn.execute(insert(tables['transcription']), [
+            {'clip_id': int(i), 'transcriber_id': int(t), 'text': 'bench',
+             'status': transcription_statuses[str(st)]}
+            for i, st, t in zip(ids, clip_status, transcriber_ids) if st != 'unassigned'
+        ])
+        print(f"  seeded {ids[-1]}/{clip_count} clips", end='\r', flush=True)
+    print()
+
+
+def _run_index_queries(conn, params, repeat):
+    from sqlalchemy import text
+
+    explain = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+    results = {}
+    for name, sql in INDEX_BENCH_QUERIES:
+        # SQLite plan rows are (id, parent, notused, detail); Postgres returns one text column
+        plan = [str(row[-1]) for row in conn.execute(text(explain + sql), params)]
+        elapsed, _ = _timeit(lambda: conn.execute(text(sql), params).fetchall(), repeat=repeat)
+        results[name] = (elapsed, plan)
+    return results
+
+
+def bench_indexes(args):
+    """Latency and query plans of the hot lookups with and without the model indexes"""
+    from sqlalchemy import create_engine, func, select, inspect
+
+    temp_dir = None
+    database_url = args.database_url
+    if not database_url:
+        temp_dir = tempfile.mkdtemp()
+        database_url = f"sqlite:///{os.path.join(temp_dir, 'bench.sqlite')}"
+
+    # Importing the models needs the app; point it at the benchmark database
+    os.environ['DATABASE_URL'] = database_url
+    from app import db
+    import models  # noqa: F401 (registers the tables)
+
+    engine = create_engine(database_url)
+    tables = db.metadata.tables
+    bench_tables = [tables[name] for name in ('user', 'audio', 'clip', 'transcription')]
+    indexes = [index for table in bench_tables for index in table.indexes]
+
+    clip_total = 0
+    if inspect(engine).has_table('clip'):
+        with engine.begin() as conn:
+            clip_total = conn.execute(select(func.count()).select_from(tables['clip'])).scalar()
+    if clip_total < args.clips:
+        print(f"Seeding {args.clips} clips into {engine.url.render_as_string(hide_password=True)}")
+        db.metadata.drop_all(engine)
+        db.metadata.create_all(engine)
+        for index in indexes:
+            index.drop(engine)
+        start_time = time.perf_counter()
+        with engine.begin() as conn:
+            _seed_clips(conn, tables, args.clips)
+        print(f"  seeding took {time.perf_counter() - start_time:.1f}s")
+    else:
+        for index in indexes:
+            index.drop(engine, checkfirst=True)
+
+    # A busy audio file and transcriber from the middle of the data set
+    with engine.begin() as conn:
+        audio_id, transcriber_id = conn.execute(
+            select(tables['clip'].c.audio_id, tables['clip'].c.transcriber_id)
+            .where(tables['clip'].c.id == args.clips // 2)
+        ).one()
+        params = {'audio_id': audio_id, 'transcriber_id': transcriber_id or 2, 'clip_id': args.clips // 2}
+
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+    with engine.connect() as conn:
+        before = _run_index_queries(conn, params, args.repeat)
+
+    start_time = time.perf_counter()
+    for index in indexes:
+        index.create(engine)
+    print(f"Created {len(indexes)} indexes in {time.perf_counter() - start_time:.1f}s")
+    if engine.dialect.name == 'sqlite':
+        with engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+    with engine.connect() as conn:
+        after = _run_index_queries(conn, params, args.repeat)
+
+    for name, _ in INDEX_BENCH_QUERIES:
+        before_time, before_plan = before[name]
+        after_time, after_plan = after[name]
+        print(f"\n{name}: {before_time * 1000:9.2f} ms -> {after_time * 1000:7.2f} ms "
+              f"({before_time / max(after_time, 1e-9):.0f}x)")
+        print("  before: " + "\n          ".join(before_plan))
+        print("  after : " + "\n          ".join(after_plan))
+
+    if temp_dir:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_assignment(args):
+    """Assigning clips row by row through the ORM vs one set-based UPDATE"""
+    from sqlalchemy import insert
+
+    temp_dir = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(temp_dir, 'bench.sqlite')}"
+    from app import app, db
+    from models import User, Audio, Clip
+    from assignment import assign_clips_to_transcriber, assign_clips_round_robin
+
+    with app.app_context():
+        db.create_all()
+        transcribers = [User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash='-',
+                             role='transcriber') for i in range(5)]
+        audio = Audio(filename='bench.wav', original_path='-', status='processed', uploader_id=1)
+        db.session.add_all(transcribers + [audio])
+        db.session.flush()
+        db.session.execute(insert(Clip), [
+            {'audio_id': audio.id, 'filename': f'clip_{i}.wav', 'path': '-', 'order': i, 'status': 'unassigned'}
+            for i in range(1, args.clips + 1)
+        ])
+        db.session.commit()
+        clip_ids = [clip_id for (clip_id,) in db.session.query(Clip.id).order_by(Clip.order)]
+        transcriber_ids = [t.id for t in transcribers]
+        print(f"Assigning {len(clip_ids)} clips")
+
+        def legacy():
+            for clip_id in clip_ids:
+                clip = db.session.get(Clip, clip_id)
+                clip.transcriber_id = transcriber_ids[0]
+                clip.status = 'assigned'
+            db.session.flush()
+
+        def run(func):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            db.session.rollback()
+            db.session.expire_all()
+            return elapsed
+
+        legacy_time = run(legacy)
+        bulk_time = run(lambda: assign_clips_to_transcriber(clip_ids, transcriber_ids[0]))
+        round_robin_time = run(lambda: assign_clips_round_robin(audio.id, transcriber_ids))
+
+    print(f"  ORM get() per clip          : {legacy_time * 1000:9.1f} ms")
+    print(f"  UPDATE ... WHERE id IN      : {bulk_time * 1000:9.1f} ms")
+    print(f"  round-robin UPDATE ... FROM : {round_robin_time * 1000:9.1f} ms")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+# What importing audio_processor used to cost every web worker before the probes became lazy
+EAGER_STARTUP_PRELUDE = (
+    "import subprocess, torch, torchaudio\n"
+    "from torch.hub import download_url_to_file\n"
+    "subprocess.run(['ffmpeg', '-version'], stdout=subprocess.PIPE, stderr=subprocess.PIPE)\n"
+)
+
+STARTUP_SCRIPT = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "{prelude}"
+    "import app\n"
+    "print(time.perf_counter() - start, 'torch' in sys.modules)\n"
+)
+
+
+def bench_startup(args):
+    """Cold import time of the web app in a fresh interpreter, as a gunicorn worker boots it"""
+    temp_dir = tempfile.mkdtemp()
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(temp_dir, 'bench.sqlite')}")
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def boot(prelude):
+        script = STARTUP_SCRIPT.format(prelude=prelude)
+        times = []
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            result = subprocess.run([sys.executable, '-c', script], cwd=here, env=env,
+                                    capture_output=True, text=True, check=True)
+            process_time = time.perf_counter() - start
+            import_time, torch_loaded = result.stdout.split()[-2:]
+            times.append((float(import_time), process_time))
+        import_times, process_times = zip(*times)
+        return float(np.median(import_times)), float(np.median(process_times)), torch_loaded == 'True'
+
+    print(f"Booting the web app {args.runs} times per mode (median)")
+    try:
+        for name, prelude in (('eager torch/ffmpeg', EAGER_STARTUP_PRELUDE), ('lazy', '')):
+            try:
+                import_time, process_time, torch_loaded = boot(prelude)
+            except subprocess.CalledProcessError as e:
+                print(f"  {name:18s}: failed ({e.stderr.strip().splitlines()[-1]})")
+                continue
+            print(f"  {name:18s}: import {import_time * 1000:7.0f} ms, process {process_time * 1000:7.0f} ms"
+                  f"  (torch loaded: {torch_loaded})")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run platform micro-benchmarks")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    vad_parser = subparsers.add_parser('vad-regions', help="Speech region extraction from a VAD probability track")
+    vad_parser.add_argument('--hours', type=float, default=1.0, help="Length of the synthetic recording")
+    vad_parser.add_argument('--repeat', type=int, default=3)
+    vad_parser.set_defaults(func=bench_vad_regions)
+
+    storage_parser = subparsers.add_parser('storage', help="Clip storage size as WAV, FLAC and Opus")
+    storage_parser.add_argument('--clips-dir', default='clips', help="Directory containing WAV clips")
+    storage_parser.set_defaults(func=bench_storage)
+
+    index_parser = subparsers.add_parser('indexes', help="Hot lookup latency and query plans with and without indexes")
+    index_parser.add_argument('--clips', type=int, default=1000000, help="Number of clips to seed")
+    index_parser.add_argument('--database-url', help="Database to seed (default: a temporary SQLite file)")
+    index_parser.add_argument('--repeat', type=int, default=5)
+    index_parser.set_defaults(func=bench_indexes)
+
+    assignment_parser = subparsers.add_parser('assignment', help="Bulk clip assignment")
+    assignment_parser.add_argument('--clips', type=int, default=10000, help="Number of clips to assign")
+    assignment_parser.set_defaults(func=bench_assignment)
+
+    startup_parser = subparsers.add_parser('startup', help="Cold start time of a web worker")
+    startup_parser.add_argument('--runs', type=int, default=5, help="Interpreter boots per mode")
+    startup_parser.set_defaults(func=bench_startup)
+
+    args = parser.parse_args()
+    args.func(args)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,463 @@
+import os
+import io
+import json
+import time
+import logging
+import zipfile
+import hashlib
+import tempfile
+from datetime import datetime
+from app import db
+from models import Clip, Transcription, ExportSnapshot
+from audio_processor import clip_format, materialize_wav, open_clip_audio, resolve_clip_path, clip_content_hash
+
+logger = logging.getLogger(__name__)
+
+# Size of the pieces clip files are copied into the archive in
+EXPORT_CHUNK_SIZE = 256 * 1024
+# Manifests are kept in memory up to this size, then spilled to an anonymous temp file
+MANIFEST_SPOOL_BYTES = 4 * 1024 * 1024
+
+
+class _ZipSink(io.RawIOBase):
+    """
+    Write-only, unseekable file that collects what zipfile writes so it can be
+    handed to the client. Because it cannot seek, zipfile writes data descriptors
+    after each member instead of going back to patch local headers.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ArchivedMember:
+    """A member of an earlier archive, copied into a new one instead of being rebuilt from the clip"""
+
+    def __init__(self, archive, name):
+        self.archive = archive
+        self.info = archive.getinfo(name)
+
+
+def _member_size(source):
+    if isinstance(source, ArchivedMember):
+        return source.info.file_size
+    if isinstance(source, bytes):
+        return len(source)
+    if isinstance(source, str):
+        return os.path.getsize(source)
+    source.seek(0, io.SEEK_END)
+    size = source.tell()
+    source.seek(0)
+    return size
+
+
+def _iter_member_chunks(source):
+    if isinstance(source, bytes):
+        yield source
+        return
+    if isinstance(source, ArchivedMember):
+        f = source.archive.open(source.info)
+    else:
+        f = open(source, 'rb') if isinstance(source, str) else source
+    try:
+        for chunk in iter(lambda: f.read(EXPORT_CHUNK_SIZE), b''):
+            yield chunk
+    finally:
+        f.close()
+
+
+def stream_zip(members):
+    """
+    Generate a ZIP archive piece by piece without buffering it.
+
+    `members` yields (arcname, source, compress_type) tuples, where source is a
+    file path, bytes, or a seekable binary file object (closed once copied). Members larger than 4 GiB
+    and archives with more than 65535 members use ZIP64 records.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as zf:
+        for arcname, source, compress_type in members:
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+            info.compress_type = compress_type
+            info.external_attr = 0o644 << 16
+            # A known size lets zipfile decide up front whether the member needs ZIP64
+            info.file_size = _member_size(source)
+            with zf.open(info, 'w') as dest:
+                for chunk in _iter_member_chunks(source):
+                    dest.write(chunk)
+                    data = sink.drain()
+                    if data:
+                        yield data
+            yield sink.drain()
+    # Central directory
+    yield sink.drain()
+
+
+class _ManifestWriter:
+    """Accumulate dataset entries as JSON Lines or as an indented JSON array"""
+
+    def __init__(self, style):
+        self.style = style
+        self.count = 0
+        self.spool = tempfile.SpooledTemporaryFile(max_size=MANIFEST_SPOOL_BYTES)
+
+    def add(self, entry):
+        if self.style == 'jsonl':
+            text = ('\n' if self.count else '') + json.dumps(entry)
+        else:
+            # Same layout as json.dumps(entries, indent=2)
+            text = (',\n' if self.count else '[\n') + \
+                '\n'.join('  ' + line for line in json.dumps(entry, indent=2).split('\n'))
+        self.spool.write(text.encode('utf-8'))
+        self.count += 1
+
+    def finish(self):
+        if self.style == 'json':
+            self.spool.write(b'\n]' if self.count else b'[]')
+        self.spool.seek(0)
+        return self.spool
+
+
+def dataset_zip_members(rows, manifest_name, manifest_style='json', audio_format='wav'):
+    """
+    Archive members for a Whisper-style dataset export.
+
+    `rows` yields (clip_path, span, arcname, text) for every clip to include, span
+    being Clip.span (the sample range of a virtual clip in its source). Audio is
+    STORED (PCM and Opus/FLAC barely compress); the manifest is DEFLATEd. Clips
+    stored as FLAC/Opus are converted to WAV unless audio_format is 'original'.
+    Clips whose file is missing are left out of both the archive and the manifest.
+    """
+    manifest = _ManifestWriter(manifest_style)
+    try:
+        for clip_path, span, arcname, text in rows:
+            member = _clip_member(clip_path, arcname, audio_format, span)
+            if member is None:
+                continue
+            arcname, source = member
+            yield arcname, source, zipfile.ZIP_STORED
+            manifest.add({'audio_filepath': arcname, 'text': text})
+
+        yield manifest_name, manifest.finish(), zipfile.ZIP_DEFLATED
+    finally:
+        manifest.spool.close()
+
+
+def _member_name(clip_path, arcname, audio_format):
+    """Name a clip is stored under: converted clips get a .wav extension"""
+    if audio_format == 'wav' and clip_format(clip_path) != 'wav':
+        return os.path.splitext(arcname)[0] + '.wav'
+    return arcname
+
+
+def _clip_member(clip_path, arcname, audio_format, span=None):
+    """(member name, source) for a clip, or None if its file is missing"""
+    path = resolve_clip_path(clip_path)
+    if path is None:
+        logger.warning(f"Export: clip file not found, skipping: {clip_path}")
+        return None
+    if span is not None:
+        # Virtual clip: a WAV view of its slice of the source
+        return arcname, open_clip_audio(path, span)
+    member_name = _member_name(path, arcname, audio_format)
+    if member_name != arcname:
+        return member_name, materialize_wav(path)
+    return member_name, path
+
+
+# --- Full-dataset export cache ---------------------------------------------
+#
+# Every full-dataset export is kept on disk as an ExportSnapshot, together with
+# an index recording, for each clip, the key it was packaged from:
+# (clip content hash, transcription text hash, approval time). A new export
+# compares the current keys with that index:
+#   - nothing changed: the stored archive is served as is;
+#   - some entries changed: unchanged members are copied out of the previous
+#     archive and only new or changed clips are read (and converted) again;
+#   - ?since=<snapshot id>: only entries that differ from that snapshot are
+#     packaged, plus a removed.json listing entries that are no longer approved.
+
+EXPORT_CACHE_DIR = os.environ.get(
+    "EXPORT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance", "exports"))
+# Archives kept per kind (full / delta); older ones are deleted but their indexes kept
+EXPORT_CACHE_KEEP = int(os.environ.get("EXPORT_CACHE_KEEP", 3))
+# A build whose archive has not grown for this long (or never started) is considered abandoned
+EXPORT_BUILD_STALL_SECONDS = int(os.environ.get("EXPORT_BUILD_STALL_SECONDS", 10 * 60))
+# How often a request sharing another request's build checks for new data
+EXPORT_FOLLOW_POLL_SECONDS = 0.5
+
+
+def _entry_key(content_hash, text, approved_at):
+    text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return [content_hash, text_hash, approved_at.isoformat() if approved_at else None]
+
+
+def current_dataset_index(audio_format):
+    """
+    {arcname: [key, member name, clip path, text, span]} for every approved transcription,
+    read with one query. Clips without a recorded content hash get one now.
+    """
+    rows = db.session.query(Clip, Transcription.text, Transcription.review_date) \
+        .join(Transcription, Transcription.clip_id == Clip.id) \
+        .filter(Transcription.status == 'approved') \
+        .order_by(Clip.audio_id, Clip.order) \
+        .yield_per(1000)
+
+    index = {}
+    hashed = 0
+    for clip, text, approved_at in rows:
+        path = resolve_clip_path(clip.path)
+        if path is None:
+            logger.warning(f"Export: clip file not found, skipping: {clip.path}")
+            continue
+        if not clip.content_hash:
+            clip.content_hash = clip_content_hash(path, clip.span)
+            hashed += 1
+        arcname = f"audio/{clip.audio_id}/{clip.filename}"
+        index[arcname] = [_entry_key(clip.content_hash, text, approved_at),
+                          _member_name(path, arcname, audio_format), clip.path, text, clip.span]
+    if hashed:
+        db.session.commit()
+        logger.info(f"Export: recorded content hashes for {hashed} clips")
+    return index
+
+
+def _fingerprint(index, audio_format):
+    digest = hashlib.sha256(audio_format.encode('utf-8'))
+    for arcname in sorted(index):
+        digest.update(json.dumps([arcname, index[arcname][0]]).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _index_path(snapshot_id):
+    return os.path.join(EXPORT_CACHE_DIR, f"export_{snapshot_id}.index.json")
+
+
+def _archive_path(snapshot_id):
+    return os.path.join(EXPORT_CACHE_DIR, f"export_{snapshot_id}.zip")
+
+
+def _temp_archive_path(snapshot_id):
+    return os.path.join(EXPORT_CACHE_DIR, f".export_{snapshot_id}.zip.tmp")
+
+
+def load_snapshot_index(snapshot):
+    """{arcname: [key, member name]} the snapshot was built from, or None if unavailable"""
+    try:
+        with open(_index_path(snapshot.id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _latest_full_archive(audio_format):
+    """Most recent full snapshot whose archive is still on disk"""
+    snapshots = ExportSnapshot.query.filter_by(kind='full', status='ready', audio_format=audio_format) \
+        .filter(ExportSnapshot.path.isnot(None)) \
+        .order_by(ExportSnapshot.id.desc()) \
+        .limit(EXPORT_CACHE_KEEP)
+    for snapshot in snapshots:
+        if os.path.exists(snapshot.path):
+            return snapshot
+    return None
+
+
+def prepare_export(audio_format='wav', base=None, user_id=None):
+    """
+    Find or start building the export of the current dataset (or, with `base`,
+    of what changed since that snapshot).
+
+    Returns:
+        tuple: (snapshot, chunks) - chunks is None when a stored archive can be
+        served as is, otherwise a generator that streams the new archive while
+        saving it as the snapshot's file. When the same archive is already being
+        built for another request, chunks follows that build instead.
+    """
+    index = current_dataset_index(audio_format)
+    fingerprint = _fingerprint(index, audio_format)
+    kind = 'delta' if base is not None else 'full'
+    fail_abandoned_builds()
+
+    same_export = ExportSnapshot.query.filter_by(kind=kind, base_id=base.id if base else None,
+                                                 audio_format=audio_format, fingerprint=fingerprint)
+    cached = same_export.filter_by(status='ready').order_by(ExportSnapshot.id.desc()).first()
+    if cached is not None and cached.path and os.path.exists(cached.path):
+        logger.info(f"Export: dataset unchanged, reusing snapshot {cached.id}")
+        return cached, None
+
+    building = same_export.filter_by(status='building').order_by(ExportSnapshot.id.desc()).first()
+    if building is not None:
+        logger.info(f"Export: snapshot {building.id} is being built, streaming it as it is written")
+        return building, _follow_build(building.id)
+
+    base_index = load_snapshot_index(base) if base is not None else {}
+    entries = [(arcname, entry) for arcname, entry in index.items() if base_index.get(arcname, [None])[0] != entry[0]]
+    removed = sorted(entry[1] for arcname, entry in base_index.items() if arcname not in index)
+
+    snapshot = ExportSnapshot(kind=kind, base_id=base.id if base else None, audio_format=audio_format,
+                              fingerprint=fingerprint, status='building', entry_count=len(entries),
+                              removed_count=len(removed), created_by=user_id, created_at=datetime.now())
+    db.session.add(snapshot)
+    db.session.commit()
+
+    previous = _latest_full_archive(audio_format)
+    return snapshot, _build_snapshot(snapshot.id, kind, audio_format, index, entries, removed, previous)
+
+
+def _build_snapshot(snapshot_id, kind, audio_format, index, entries, removed, previous):
+    # Runs while the response streams, possibly in a fresh session: work with
+    # plain values and reload the snapshot row when it needs updating
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    path = _archive_path(snapshot_id)
+    temp_path = _temp_archive_path(snapshot_id)
+    previous_id = previous.id if previous else None
+    previous_index = load_snapshot_index(previous) if previous else None
+    previous_archive = zipfile.ZipFile(previous.path) if previous_index else None
+    reused = 0
+
+    def members():
+        nonlocal reused
+        manifest = _ManifestWriter('json')
+        try:
+            for arcname, (key, member_name, clip_path, text, span) in entries:
+                cached = previous_index.get(arcname) if previous_index else None
+                if cached is not None and cached[0] == key and cached[1] in previous_archive.NameToInfo:
+                    source = ArchivedMember(previous_archive, cached[1])
+                    reused += 1
+                else:
+                    member = _clip_member(clip_path, arcname, audio_format, span)
+                    if member is None:
+                        continue
+                    member_name, source = member
+                yield member_name, source, zipfile.ZIP_STORED
+                manifest.add({'audio_filepath': member_name, 'text': text})
+
+            yield 'dataset.json', manifest.finish(), zipfile.ZIP_DEFLATED
+            if removed:
+                yield 'removed.json', json.dumps(removed, indent=2).encode('utf-8'), zipfile.ZIP_DEFLATED
+        finally:
+            manifest.spool.close()
+
+    start_time = time.time()
+    completed = False
+    try:
+        with open(temp_path, 'wb') as f:
+            for chunk in stream_zip(members()):
+                f.write(chunk)
+                yield chunk
+        os.replace(temp_path, path)
+        with open(_index_path(snapshot_id), 'w') as f:
+            json.dump({arcname: entry[:2] for arcname, entry in index.items()}, f)
+
+        snapshot = db.session.get(ExportSnapshot, snapshot_id)
+        snapshot.path = path
+        snapshot.size_bytes = os.path.getsize(path)
+        snapshot.status = 'ready'
+        db.session.commit()
+        completed = True
+        logger.info(f"Export: built {kind} snapshot {snapshot_id} with {len(entries)} entries "
+                    f"({reused} copied from snapshot {previous_id or '-'}) "
+                    f"in {time.time() - start_time:.2f}s")
+        prune_snapshots()
+    finally:
+        if previous_archive is not None:
+            previous_archive.close()
+        if not completed:
+            # Client went away or the build failed: keep nothing half-written
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            db.session.rollback()
+            db.session.get(ExportSnapshot, snapshot_id).status = 'failed'
+            db.session.commit()
+
+
+def _follow_build(snapshot_id):
+    """
+    Stream an archive that another request is building, reading its temporary
+    file as it grows. Ends once the build is ready; raises if it fails or stalls.
+    """
+    temp_path = _temp_archive_path(snapshot_id)
+    f = None
+    last_data = time.time()
+    try:
+        while True:
+            if f is None:
+                try:
+                    f = open(temp_path, 'rb')
+                except FileNotFoundError:
+                    pass
+            chunk = f.read(EXPORT_CHUNK_SIZE) if f is not None else b''
+            if chunk:
+                last_data = time.time()
+                yield chunk
+                continue
+
+            snapshot = db.session.get(ExportSnapshot, snapshot_id, populate_existing=True)
+            status, path = snapshot.status, snapshot.path
+            # Do not keep a transaction open while waiting (SQLite would block the builder's commit)
+            db.session.rollback()
+            if status == 'ready':
+                # The builder renamed the temporary file, which an open handle still reads
+                if f is None:
+                    f = open(path, 'rb')
+                for chunk in iter(lambda: f.read(EXPORT_CHUNK_SIZE), b''):
+                    yield chunk
+                return
+            if status != 'building' or time.time() - last_data > EXPORT_BUILD_STALL_SECONDS:
+                raise RuntimeError(f"Export snapshot {snapshot_id} failed while being streamed")
+            time.sleep(EXPORT_FOLLOW_POLL_SECONDS)
+    finally:
+        if f is not None:
+            f.close()
+
+
+def fail_abandoned_builds():
+    """
+    Mark 'building' snapshots as failed once their archive has stopped growing,
+    e.g. because the client went away before the build started or the worker died
+    """
+    abandoned = 0
+    for snapshot in ExportSnapshot.query.filter_by(status='building'):
+        temp_path = _temp_archive_path(snapshot.id)
+        try:
+            last_activity = os.path.getmtime(temp_path)
+        except FileNotFoundError:
+            temp_path = None
+            last_activity = snapshot.created_at.timestamp()
+        if time.time() - last_activity <= EXPORT_BUILD_STALL_SECONDS:
+            continue
+        if temp_path is not None:
+            os.remove(temp_path)
+        snapshot.status = 'failed'
+        abandoned += 1
+    if abandoned:
+        db.session.commit()
+        logger.warning(f"Export: marked {abandoned} abandoned snapshot builds as failed")
+
+
+def prune_snapshots():
+    """Delete archives beyond the newest EXPORT_CACHE_KEEP of each kind (indexes are kept for deltas)"""
+    fail_abandoned_builds()
+    for kind in ('full', 'delta'):
+        stale = ExportSnapshot.query.filter_by(kind=kind, status='ready') \
+            .filter(ExportSnapshot.path.isnot(None)) \
+            .order_by(ExportSnapshot.id.desc()) \
+            .offset(EXPORT_CACHE_KEEP).all()
+        for snapshot in stale:
+            if os.path.exists(snapshot.path):
+                os.remove(snapshot.path)
+            snapshot.path = None
+    db.session.commit()
@@ -1,7 +1,7 @@
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileRequired, FileAllowed
-from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, SelectField, HiddenField
-from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
+from wtforms import StringField, PasswordField, SubmitField, BooleanField, TextAreaField, SelectField, HiddenField, SelectMultipleField, IntegerField, FloatField
+from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError, Optional, NumberRange
 
 class LoginForm(FlaskForm):
     username = StringField('Username', validators=[DataRequired()])
@@ -33,3 +33,17 @@ class TranscriptionForm(FlaskForm):
 class AssignmentForm(FlaskForm):
     transcriber = SelectField('Assign to Transcriber', choices=[], validators=[DataRequired()])
     submit = SubmitField('Assign Selected Clips')
+
+class RoundRobinAssignmentForm(FlaskForm):
+    transcribers = SelectMultipleField('Transcribers', coerce=int, choices=[], validators=[DataRequired()])
+    count = IntegerField('Number of Clips', validators=[Optional(), NumberRange(min=1)])
+    submit = SubmitField('Distribute Unassigned Clips')
+
+class ResegmentForm(FlaskForm):
+    threshold = FloatField('Speech Threshold', validators=[DataRequired(), NumberRange(min=0.05, max=0.95)])
+    min_speech_duration_ms = IntegerField('Min Speech (ms)', validators=[Optional(), NumberRange(min=0)])
+    min_silence_duration_ms = IntegerField('Min Silence (ms)', validators=[Optional(), NumberRange(min=0)])
+    speech_pad_ms = IntegerField('Padding (ms)', validators=[Optional(), NumberRange(min=0)])
+    max_speech_duration_s = FloatField('Max Clip Length (s)', validators=[Optional(), NumberRange(min=1)])
+    min_clip_duration_s = FloatField('Min Clip Length (s)', validators=[Optional(), NumberRange(min=0)])
+    submit = SubmitField('Re-segment')
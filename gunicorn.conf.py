@@ -0,0 +1,25 @@
+# Gunicorn picks this file up automatically from the working directory.
+# Command line flags (Procfile, railway.json, Dockerfile) still take precedence.
+import os
+
+# Off by default: segmentation runs in worker.py, and loading the model here would
+# undo the web tier's lazy torch import. The segmentation workers use WORKER_VAD_PRELOAD.
+WEB_VAD_PRELOAD = os.environ.get("WEB_VAD_PRELOAD") == "1"
+
+
+def on_starting(server):
+    """Optionally load the VAD model in the master so forked workers share it copy-on-write"""
+    if WEB_VAD_PRELOAD:
+        from audio_processor import warm_up_vad_model
+        warm_up_vad_model(run_inference=False)
+
+
+def post_fork(server, worker):
+    """Run the first (JIT-compiling) inference in each worker after the fork"""
+    if WEB_VAD_PRELOAD:
+        from audio_processor import warm_up_vad_model
+        warm_up_vad_model(run_inference=True)
+
+    # Take the first readiness snapshot before the worker gets its first /readyz probe
+    from readiness import ensure_readiness_monitor
+    ensure_readiness_monitor()
@@ -30,6 +30,15 @@ def health_check():
         'timestamp': time.time()
     }), 200
 
+@app.route('/livez')
+def liveness_check():
+    return jsonify({'status': 'alive'}), 200
+
+@app.route('/readyz')
+def readiness_check():
+    # The application itself is not up yet
+    return jsonify({'status': 'initializing'}), 503
+
 def run_server():
     port = int(os.environ.get("PORT", 5000))
     logger.info(f"Starting standalone health check server on port {port}")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+One-shot database initialization.
+
+Creates missing tables, adds columns and indexes introduced since the database
+was created (migrations.upgrade_schema), fills the status counters, creates the
+default admin user and fixes legacy clip paths. Run it once per deploy, before
+the web server and the segmentation workers start (prestart.sh does), so that
+importing the app does no schema work and concurrently booting workers never
+contend for DDL locks. Processes that only use the database, like worker.py,
+call wait_for_schema() instead of initializing it themselves.
+
+Usage:
+    python init_db.py [--skip-clip-paths]
+"""
+
+import sys
+import time
+import logging
+import argparse
+from werkzeug.security import generate_password_hash
+from app import app, db
+from models import User
+from migrations import upgrade_schema, missing_schema
+from stats import ensure_status_counters
+
+logger = logging.getLogger(__name__)
+
+
+def ensure_admin_user():
+    """Create the default admin user if it does not exist; returns True if it was created"""
+    if User.query.filter_by(username='admin').first() is not None:
+        return False
+    db.session.add(User(
+        username='admin',
+        email='admin@example.com',
+        password_hash=generate_password_hash('admin'),
+        role='admin'
+    ))
+    db.session.commit()
+    logger.info("Admin user created")
+    return True
+
+
+def initialize_database(fix_paths=True):
+    """
+    Bring the database up to date. Safe to run repeatedly.
+
+    Returns:
+        dict: added schema changes, whether the admin user was created and the number of fixed clip paths
+    """
+    with app.app_context():
+        db.create_all()
+        changes = upgrade_schema()
+        ensure_status_counters()
+        admin_created = ensure_admin_user()
+
+    fixed_paths = 0
+    if fix_paths:
+        from fix_clip_paths import fix_clip_paths
+        fixed_paths = fix_clip_paths()
+
+    return {'schema_changes': changes, 'admin_created': admin_created, 'fixed_clip_paths': fixed_paths}
+
+
+def wait_for_schema(timeout=300, poll_interval=5):
+    """
+    Block until another process has initialized the database (e.g. the web
+    service's prestart.sh on a fresh deploy). Raises RuntimeError after `timeout` seconds.
+    """
+    deadline = time.time() + timeout
+    with app.app_context():
+        while True:
+            try:
+                missing = missing_schema()
+            except Exception as e:
+                missing = [f"database unavailable ({str(e)})"]
+            if not missing:
+                return
+            if time.time() >= deadline:
+                raise RuntimeError(f"Database schema is not initialized, missing: {', '.join(missing[:10])}. "
+                                   f"Run python init_db.py")
+            logger.info(f"Waiting for the database schema (missing: {', '.join(missing[:5])})...")
+            time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or upgrade the database schema and bootstrap data")
+    parser.add_argument('--skip-clip-paths', action='store_true', help="Do not run the clip path fix")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s')
+    start_time = time.time()
+    try:
+        summary = initialize_database(fix_paths=not args.skip_clip_paths)
+    except Exception:
+        logger.exception(f"Database initialization failed after {time.time() - start_time:.2f}s")
+        return 1
+
+    for change in summary['schema_changes']:
+        print(f"  ✓ Added {change}")
+    print(f"  ✓ {'Default admin user created' if summary['admin_created'] else 'Admin user already exists'}")
+    print(f"  ✓ Fixed {summary['fixed_clip_paths']} clip paths")
+    print(f"  ✓ Database initialization completed in {time.time() - start_time:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
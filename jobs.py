@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import socket
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert
+from app import app, db
+from models import Audio, Clip, ProcessingJob
+from audio_processor import process_audio_file, clip_content_hash
+from segmentation import DEFAULT_VAD_PARAMS
+from stats import record_bulk_delete, record_status_changes
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before retrying a failed job (multiplied by the attempt number)
+RETRY_BACKOFF_SECONDS = int(os.environ.get("JOB_RETRY_BACKOFF", 30))
+# A job stuck in 'processing' longer than this is assumed to belong to a dead worker
+STALE_JOB_SECONDS = int(os.environ.get("JOB_STALE_AFTER", 2 * 60 * 60))
+# How often a running worker looks for jobs abandoned by dead workers
+STALE_CHECK_SECONDS = int(os.environ.get("JOB_STALE_CHECK_INTERVAL", 5 * 60))
+# Segment record fields stored on Clip as they are
+SEGMENT_FIELDS = ('start_sample', 'end_sample', 'duration', 'sample_rate', 'rms', 'peak', 'speech_prob', 'virtual')
+
+
+def enqueue_segmentation(audio, max_attempts=3, vad_params=None):
+    """
+    Queue a segmentation job for an Audio record.
+    With `vad_params` (overrides of DEFAULT_VAD_PARAMS) the job re-segments the
+    recording from its cached speech probabilities.
+    The caller is responsible for committing the session.
+    """
+    job = ProcessingJob(
+        audio_id=audio.id,
+        status='pending',
+        max_attempts=max_attempts,
+        created_at=datetime.now(),
+        run_after=datetime.now(),
+        vad_params=json.dumps(vad_params) if vad_params is not None else None
+    )
+    db.session.add(job)
+    return job
+
+
+def queue_depth():
+    """Number of jobs waiting to be picked up"""
+    return ProcessingJob.query.filter_by(status='pending').count()
+
+
+def claim_next_job(worker_id):
+    """
+    Atomically move the oldest runnable pending job to 'processing'.
+    The conditional UPDATE makes sure two workers can never claim the same job.
+    Returns the claimed job id or None.
+    """
+    for _ in range(5):
+        candidate = db.session.query(ProcessingJob.id).filter(
+            ProcessingJob.status == 'pending',
+            ProcessingJob.run_after <= datetime.now()
+        ).order_by(ProcessingJob.id).limit(1).scalar()
+        if candidate is None:
+            db.session.rollback()
+            return None
+
+        result = db.session.execute(
+            update(ProcessingJob)
+            .where(ProcessingJob.id == candidate, ProcessingJob.status == 'pending')
+            .values(
+                status='processing',
+                attempts=ProcessingJob.attempts + 1,
+                worker_id=worker_id,
+                started_at=datetime.now()
+            )
+        )
+        db.session.commit()
+        if result.rowcount == 1:
+            return candidate
+        # Another worker won the race, try the next candidate
+    return None
+
+
+def recover_stale_jobs():
+    """
+    Handle jobs whose worker died mid-run. Jobs with attempts left go back into
+    the queue; a recording that keeps killing its worker (OOM, crash) has used
+    up its attempts and is marked 'error' together with its audio.
+    Returns the number of re-queued jobs.
+    """
+    now = datetime.now()
+    stale = (ProcessingJob.status == 'processing',
+             ProcessingJob.started_at < now - timedelta(seconds=STALE_JOB_SECONDS))
+    exhausted = ProcessingJob.attempts >= ProcessingJob.max_attempts
+
+    # Audio rows first, while the jobs still identify them as stale
+    db.session.execute(
+        update(Audio)
+        .where(Audio.id.in_(select(ProcessingJob.audio_id).where(*stale, exhausted)))
+        .values(status='error')
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(
+        update(Audio)
+        .where(Audio.id.in_(select(ProcessingJob.audio_id).where(*stale, ~exhausted)))
+        .values(status='pending')
+        .execution_options(synchronize_session=False)
+    )
+    failed = db.session.execute(
+        update(ProcessingJob)
+        .where(*stale, exhausted)
+        .values(status='error', finished_at=now,
+                error_message='Worker died while processing this job and no attempts are left')
+    )
+    requeued = db.session.execute(
+        update(ProcessingJob)
+        .where(*stale, ~exhausted)
+        .values(status='pending', run_after=now)
+    )
+    db.session.commit()
+    if requeued.rowcount:
+        logger.warning(f"Re-queued {requeued.rowcount} stale segmentation jobs")
+    if failed.rowcount:
+        logger.error(f"Gave up on {failed.rowcount} stale segmentation jobs after their last attempt")
+    return requeued.rowcount
+
+
+def _segment_hash(segment, source_hashes):
+    """Content hash of a new clip; the source of virtual clips is hashed once per recording"""
+    path = segment['path']
+    if not os.path.exists(path):
+        return None
+    if not segment['virtual']:
+        return clip_content_hash(path)
+    if path not in source_hashes:
+        source_hashes[path] = clip_content_hash(path)
+    span = (segment['start_sample'], segment['end_sample'])
+    return clip_content_hash(path, span, source_hashes[path])
+
+
+def run_segmentation_job(job_id):
+    """
+    Run VAD segmentation for a claimed job and store the resulting clips.
+    Failures are retried with a linear backoff until max_attempts is reached,
+    after which both the job and the audio are marked as 'error'.
+    """
+    job = db.session.get(ProcessingJob, job_id)
+    audio = db.session.get(Audio, job.audio_id)
+    if audio is None:
+        job.status = 'error'
+        job.error_message = 'Audio record no longer exists'
+        job.finished_at = datetime.now()
+        db.session.commit()
+        return
+
+    audio.status = 'processing'
+    db.session.commit()
+
+    try:
+        logger.info(f"Job {job.id}: starting audio processing for {audio.original_path}")
+        vad_params = json.loads(job.vad_params) if job.vad_params else None
+        segments = process_audio_file(audio.original_path, audio.id, app.config['UPLOAD_FOLDER'],
+                                      vad_params=vad_params, reuse_probs=vad_params is not None)
+        source_hashes = {}
+
+        # Drop clips left behind by an earlier failed attempt
+        stale_clips = Clip.query.filter_by(audio_id=audio.id)
+        record_bulk_delete(stale_clips)
+        stale_clips.delete()
+        if segments:
+            # One executemany INSERT for all clips instead of a row-by-row flush
+            db.session.execute(insert(Clip), [
+                {
+                    'audio_id': audio.id,
+                    'filename': f"clip_{i + 1}.wav" if segment['virtual'] else os.path.basename(segment['path']),
+                    'path': segment['path'],
+                    'order': i + 1,
+                    'status': 'unassigned',
+                    'content_hash': _segment_hash(segment, source_hashes),
+                    **{field: segment[field] for field in SEGMENT_FIELDS}
+                }
+                for i, segment in enumerate(segments)
+            ])
+            record_status_changes(Clip, {'unassigned': len(segments)})
+
+        durations = [segment['duration'] for segment in segments if segment['duration'] is not None]
+        audio.status = 'processed'
+        audio.clip_count = len(segments)
+        audio.speech_seconds = sum(durations) if durations else None
+        audio.vad_params = json.dumps({**DEFAULT_VAD_PARAMS, **(vad_params or {})})
+        job.status = 'processed'
+        job.error_message = None
+        job.finished_at = datetime.now()
+        db.session.commit()
+        logger.info(f"Job {job.id}: {len(segments)} clips extracted from audio {audio.id}")
+
+    except Exception as e:
+        logger.error(f"Job {job_id}: error processing audio: {str(e)}", exc_info=True)
+        db.session.rollback()
+
+        job = db.session.get(ProcessingJob, job_id)
+        audio = db.session.get(Audio, job.audio_id)
+        job.error_message = str(e)
+        if job.attempts < job.max_attempts:
+            job.status = 'pending'
+            job.run_after = datetime.now() + timedelta(seconds=RETRY_BACKOFF_SECONDS * job.attempts)
+            audio.status = 'pending'
+        else:
+            job.status = 'error'
+            job.finished_at = datetime.now()
+            audio.status = 'error'
+        db.session.commit()
+
+
+def run_worker(worker_id=None, poll_interval=2.0, stop_event=None):
+    """Poll the job table forever, processing one job at a time"""
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Segmentation worker {worker_id} started")
+
+    with app.app_context():
+        next_stale_check = 0
+        while stop_event is None or not stop_event.is_set():
+            # Jobs of workers that died while this one was running are picked up periodically
+            if time.monotonic() >= next_stale_check:
+                try:
+                    recover_stale_jobs()
+                except Exception as e:
+                    logger.error(f"Worker {worker_id}: could not recover stale jobs: {str(e)}")
+                    db.session.rollback()
+                next_stale_check = time.monotonic() + STALE_CHECK_SECONDS
+
+            try:
+                job_id = claim_next_job(worker_id)
+            except Exception as e:
+                logger.error(f"Worker {worker_id}: could not claim job: {str(e)}")
+                db.session.rollback()
+                job_id = None
+
+            if job_id is None:
+                time.sleep(poll_interval)
+                continue
+
+            try:
+                run_segmentation_job(job_id)
+            finally:
+                db.session.remove()
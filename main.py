@@ -2,6 +2,13 @@ import os
 from app import app
 
 if __name__ == "__main__":
+    # Running without prestart.sh (local development), so set up the database here
+    from init_db import initialize_database
+    initialize_database(fix_paths=False)
+    
+    from readiness import ensure_readiness_monitor
+    ensure_readiness_monitor()
+    
     # Use PORT from environment variable for Railway compatibility
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=False)
@@ -0,0 +1,210 @@
+"""
+Prometheus metrics in the text exposition format, without extra dependencies.
+
+Metrics live in the memory of the process that records them. Web workers
+expose theirs at /metrics; segmentation worker processes can serve theirs on
+WORKER_METRICS_PORT (+ the worker index) with start_metrics_server(). Behind
+gunicorn with several workers each scrape reflects the worker that answered it.
+"""
+
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Seconds; from fast queries up to long segmentation and export runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing value, e.g. bytes served"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets, plus their sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of a with block"""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, **labels)
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render():
+    """All metrics of this process in the Prometheus text format"""
+    with _registry_lock:
+        metrics = list(_registry)
+    return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REQUEST_SECONDS = Histogram('http_request_duration_seconds', 'Request latency by route',
+                            ['route', 'method', 'status'])
+REQUEST_DB_QUERIES = Histogram('http_request_db_queries', 'Database queries issued per request', ['route'],
+                               buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500))
+DB_COMMIT_SECONDS = Histogram('db_commit_seconds', 'Session commit time, including the flush')
+UPLOAD_SAVE_SECONDS = Histogram('upload_save_seconds', 'Time to write an uploaded recording to disk')
+UPLOAD_BYTES = Counter('upload_bytes_total', 'Bytes of uploaded recordings saved')
+SEGMENTATION_STAGE_SECONDS = Histogram('segmentation_stage_seconds',
+                                       'Time spent per segmentation stage and recording '
+                                       '(decode, vad_inference, clip_write, ...)', ['stage'])
+CLIP_BYTES_SERVED = Counter('clip_served_bytes_total', 'Audio bytes sent by serve_clip', ['format', 'status'])
+EXPORT_SECONDS = Histogram('export_duration_seconds', 'Time to build and stream a dataset export', ['kind'])
+EXPORT_BYTES = Counter('export_bytes_total', 'Bytes of dataset exports sent', ['kind'])
+
+
+def timed_stream(chunks, kind):
+    """Pass an export's chunks through, recording its duration and size once it is fully sent"""
+    start_time = time.perf_counter()
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+        yield chunk
+    EXPORT_SECONDS.observe(time.perf_counter() - start_time, kind=kind)
+    EXPORT_BYTES.inc(size, kind=kind)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    """Count the request's queries; also notes when they start if the SQL profiler (profiling.py) times them"""
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+        if g.get('time_queries'):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Session, 'before_commit')
+def _commit_started(session):
+    session.info['metrics_commit_start'] = time.perf_counter()
+
+
+@event.listens_for(Session, 'after_commit')
+def _commit_finished(session):
+    start_time = session.info.pop('metrics_commit_start', None)
+    if start_time is not None:
+        DB_COMMIT_SECONDS.observe(time.perf_counter() - start_time)
+
+
+def init_app(app):
+    """Time every request of a Flask app and count its queries"""
+
+    @app.before_request
+    def _start_request_timer():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    # Measures the handler up to the start of the response body. Teardown runs a second
+    # time after a stream_with_context body; streamed exports are timed by timed_stream().
+    @app.teardown_request
+    def _observe_request(exc):
+        start_time = g.pop('metrics_start', None)
+        if start_time is None:
+            return
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        status = 500 if exc is not None else g.get('metrics_status', 500)
+        REQUEST_SECONDS.observe(time.perf_counter() - start_time, route=route, method=request.method, status=status)
+        REQUEST_DB_QUERIES.observe(g.metrics_queries, route=route)
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """Serve this process's metrics over HTTP from a daemon thread (for processes without Flask)"""
+    from wsgiref.simple_server import make_server, WSGIRequestHandler
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+    def metrics_app(environ, start_response):
+        body = render().encode('utf-8')
+        start_response('200 OK', [('Content-Type', CONTENT_TYPE), ('Content-Length', str(len(body)))])
+        return [body]
+
+    server = make_server(host, port, metrics_app, handler_class=QuietHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    logger.info(f"Serving metrics on port {port}")
+    return server
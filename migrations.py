@@ -0,0 +1,87 @@
+import time
+import logging
+from sqlalchemy import inspect, text
+from app import db
+
+logger = logging.getLogger(__name__)
+
+
+def upgrade_schema():
+    """
+    Bring an existing database up to date with the models.
+
+    db.create_all() only creates missing tables and never alters existing ones,
+    so columns and indexes added to a model later are added here.
+    New columns must be nullable (existing rows have no value for them).
+    Must be called inside an application context.
+
+    Returns:
+        list: "table.column" names of the columns and names of the indexes that were added
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    preparer = db.engine.dialect.identifier_preparer
+    added = []
+
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.quote(table.name)} "
+                    f"ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                ))
+                added.append(f"{table.name}.{column.name}")
+                logger.info(f"Added column {table.name}.{column.name}")
+
+    added.extend(_create_missing_indexes(inspector, existing_tables))
+    return added
+
+
+def _create_missing_indexes(inspector, existing_tables):
+    """
+    Create the indexes declared in __table_args__ that existing tables lack.
+    Each index is created in its own transaction so that one failure (e.g. a
+    unique index over duplicate rows) is reported without blocking the others.
+    """
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name in existing_indexes:
+                continue
+            try:
+                start_time = time.time()
+                with db.engine.begin() as conn:
+                    index.create(conn)
+                added.append(index.name)
+                logger.info(f"Created index {index.name} on {table.name} ({time.time() - start_time:.2f}s)")
+            except Exception as e:
+                logger.error(f"Could not create index {index.name} on {table.name}: {str(e)}")
+    return added
+
+
+def missing_schema():
+    """
+    Tables and "table.column" names of the models that the database lacks
+    (what db.create_all() and upgrade_schema() would add). Must be called
+    inside an application context.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            missing.append(table.name)
+            continue
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        missing.extend(f"{table.name}.{column.name}" for column in table.columns
+                       if column.name not in existing_columns)
+    return missing
@@ -24,9 +24,16 @@ class Audio(db.Model):
     status = db.Column(db.String(50), default='pending')  # pending, processing, processed, error
     uploader_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     clip_count = db.Column(db.Integer, default=0)
+    speech_seconds = db.Column(db.Float, nullable=True)  # Total duration of the clips
+    vad_params = db.Column(db.Text, nullable=True)  # JSON of the VAD parameters the clips were cut with
+    
+    __table_args__ = (
+        db.Index('ix_audio_upload_date', 'upload_date'),  # Dashboard lists newest first
+    )
     
     # Relationships
     clips = db.relationship('Clip', backref='audio', lazy=True, cascade="all, delete-orphan")
+    jobs = db.relationship('ProcessingJob', backref='audio', lazy=True, cascade="all, delete-orphan")
 
 class Clip(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -36,9 +43,37 @@ class Clip(db.Model):
     order = db.Column(db.Integer, nullable=False)  # Order in the original audio
     status = db.Column(db.String(50), default='unassigned')  # unassigned, assigned, submitted, completed
     transcriber_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    content_hash = db.Column(db.String(64), nullable=True)  # SHA-256 of the stored clip file, used as ETag
+    # Segment metadata recorded at segmentation time (offsets in samples of the decoded source)
+    start_sample = db.Column(db.BigInteger, nullable=True)
+    end_sample = db.Column(db.BigInteger, nullable=True)
+    duration = db.Column(db.Float, nullable=True)  # Seconds
+    sample_rate = db.Column(db.Integer, nullable=True)
+    rms = db.Column(db.Float, nullable=True)  # Linear level, 0-1
+    peak = db.Column(db.Float, nullable=True)  # Linear level, 0-1
+    speech_prob = db.Column(db.Float, nullable=True)  # Mean VAD speech probability
+    # Virtual clips have no file of their own: path is the recording's normalized
+    # source and start_sample/end_sample the clip's range in it
+    virtual = db.Column(db.Boolean, nullable=True, default=False)
+    
+    __table_args__ = (
+        # Clips of an audio in playback order (review, assignment, export)
+        db.Index('ix_clip_audio_order', 'audio_id', 'order'),
+        # A transcriber's clips, grouped by audio (transcriber dashboard and transcribe page)
+        db.Index('ix_clip_transcriber_audio', 'transcriber_id', 'audio_id'),
+        # Clips still waiting to be assigned
+        db.Index('ix_clip_unassigned', 'audio_id',
+                 postgresql_where=db.text("status = 'unassigned'"),
+                 sqlite_where=db.text("status = 'unassigned'")),
+    )
     
     # Relationships
     transcription = db.relationship('Transcription', backref='clip', lazy=True, cascade="all, delete-orphan", uselist=False)
+    
+    @property
+    def span(self):
+        """(start_sample, end_sample) in the source for virtual clips, None for clips stored as files"""
+        return (self.start_sample, self.end_sample) if self.virtual else None
 
 class Transcription(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -50,3 +85,54 @@ class Transcription(db.Model):
     update_date = db.Column(db.DateTime, default=datetime.now)
     reviewed_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     review_date = db.Column(db.DateTime, nullable=True)
+    
+    __table_args__ = (
+        # At most one transcription per clip (Clip.transcription is uselist=False)
+        db.Index('ix_transcription_clip', 'clip_id', unique=True),
+        # Review queue
+        db.Index('ix_transcription_submitted', 'clip_id',
+                 postgresql_where=db.text("status = 'submitted'"),
+                 sqlite_where=db.text("status = 'submitted'")),
+    )
+
+class ProcessingJob(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    audio_id = db.Column(db.Integer, db.ForeignKey('audio.id'), nullable=False)
+    status = db.Column(db.String(50), default='pending')  # pending, processing, processed, error (same values as Audio.status)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    worker_id = db.Column(db.String(100), nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    run_after = db.Column(db.DateTime, default=datetime.now)  # Earliest time a retry may be picked up
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    vad_params = db.Column(db.Text, nullable=True)  # JSON VAD parameter overrides; set for re-segmentation
+    
+    __table_args__ = (
+        # Jobs ready to be claimed
+        db.Index('ix_processing_job_pending', 'run_after',
+                 postgresql_where=db.text("status = 'pending'"),
+                 sqlite_where=db.text("status = 'pending'")),
+    )
+
+class StatusCounter(db.Model):
+    """Number of clips/transcriptions per status, kept up to date by stats.py"""
+    entity = db.Column(db.String(20), primary_key=True)  # 'clip' or 'transcription'
+    status = db.Column(db.String(50), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class ExportSnapshot(db.Model):
+    """A dataset archive built by the full-dataset export, kept for reuse (see exports.py)"""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'full', or 'delta' (changes since base_id)
+    base_id = db.Column(db.Integer, db.ForeignKey('export_snapshot.id'), nullable=True)
+    audio_format = db.Column(db.String(20), nullable=False)  # 'wav' or 'original'
+    fingerprint = db.Column(db.String(64), nullable=False)  # Hash of the dataset state it was built from
+    status = db.Column(db.String(20), default='building')  # building, ready, failed
+    entry_count = db.Column(db.Integer, default=0)
+    removed_count = db.Column(db.Integer, default=0)
+    size_bytes = db.Column(db.BigInteger, nullable=True)
+    path = db.Column(db.String(255), nullable=True)  # Archive on disk; cleared when pruned
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.now)
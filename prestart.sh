@@ -160,61 +160,7 @@ fi
 
 # Run database migrations with comprehensive error handling and reporting
 echo "Initializing database..." | timestamp
-python -c "
-import sys
-import traceback
-import time
-from datetime import datetime
-
-start_time = time.time()
-
-try:
-    print(f'  ℹ Starting database initialization at {datetime.now().isoformat()}')
-    
-    # First import the app and db
-    from app import app, db, User
-    app.app_context().push()
-    
-    # Create all tables
-    print('  ℹ Creating database schema...')
-    db.create_all()
-    print(f'  ✓ Database schema created/updated successfully ({time.time() - start_time:.2f}s)')
-    
-    # Create admin user if it doesn't exist
-    admin = User.query.filter_by(username='admin').first()
-    if not admin:
-        print('  ℹ Creating default admin user...')
-        from werkzeug.security import generate_password_hash
-        admin = User(
-            username='admin',
-            email='admin@example.com',
-            password_hash=generate_password_hash('admin'),
-            role='admin'
-        )
-        db.session.add(admin)
-        db.session.commit()
-        print('  ✓ Default admin user created')
-    else:
-        print('  ✓ Admin user already exists')
-    
-    # Run clip path fix if needed
-    print('  ℹ Running clip path fix script...')
-    from fix_clip_paths import fix_clip_paths
-    fixed_count = fix_clip_paths()
-    if fixed_count > 0:
-        print(f'  ✓ Fixed {fixed_count} clip paths')
-    else:
-        print('  ✓ No clip paths needed fixing')
-    
-    print(f'  ✓ Database initialization completed in {time.time() - start_time:.2f}s')
-    
-except Exception as e:
-    elapsed = time.time() - start_time
-    print(f'  ✗ ERROR initializing database after {elapsed:.2f}s: {str(e)}')
-    print('  ℹ Full traceback:')
-    traceback.print_exc(file=sys.stdout)
-    sys.exit(1)
-" || echo "  ✗ Database initialization failed. The application may not work correctly." | timestamp
+python init_db.py || echo "  ✗ Database initialization failed. The application may not work correctly." | timestamp
 
 # Ensure correct permissions (important in containerized environments)
 echo "Setting correct permissions..." | timestamp
@@ -247,6 +193,11 @@ else
   echo "  ⚠ WARNING: PyTorch not installed or having issues. Audio processing may fail." | timestamp
 fi
 
+# The application server binds the same port, so the placeholder must be gone first
+echo "Stopping health check server..." | timestamp
+kill $HEALTH_SERVER_PID 2>/dev/null && wait $HEALTH_SERVER_PID 2>/dev/null || true
+echo "  ✓ Health check server stopped" | timestamp
+
 echo "===============================================" | timestamp
 echo "✓ Prestart initialization completed successfully" | timestamp
 echo "===============================================" | timestamp
@@ -0,0 +1,139 @@
+"""
+Opt-in per-request SQL profiler (SQL_PROFILING=1), meant for staging.
+
+Every request records its query count, total database time and its most
+repeated statements. Requests slower than SLOW_REQUEST_MS or issuing at least
+SLOW_REQUEST_QUERIES queries are logged as one JSON line, which makes N+1
+loops easy to spot. Responses carry X-SQL-Queries and Server-Timing headers
+(queries issued before the body; a streamed body's queries only show up in the
+log and in /admin/debug/sql_profile, which lists the last requests of this process).
+
+Statements are timed from the start noted by the query counter of metrics.py,
+so metrics.init_app() must be set up as well; with profiling disabled no
+listener of this module is registered.
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from collections import Counter, deque
+from flask import g, request, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILING = os.environ.get("SQL_PROFILING") == "1"
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 500))
+SLOW_REQUEST_QUERIES = int(os.environ.get("SLOW_REQUEST_QUERIES", 100))
+# Repeated statements listed per request
+SQL_PROFILE_TOP = int(os.environ.get("SQL_PROFILE_TOP", 5))
+# Request profiles kept for /admin/debug/sql_profile
+SQL_PROFILE_HISTORY = int(os.environ.get("SQL_PROFILE_HISTORY", 200))
+
+_recent = deque(maxlen=SQL_PROFILE_HISTORY)
+_recent_lock = threading.Lock()
+
+# "IN (?, ?, ?)" lists of any length count as the same statement
+_PARAMETER_LIST = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*,)+\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_statement(statement):
+    """Statement text with whitespace collapsed and parameter lists shortened"""
+    return _PARAMETER_LIST.sub('(?)', _WHITESPACE.sub(' ', statement).strip())
+
+
+class RequestProfile:
+    """Queries issued while handling one request"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.statements = Counter()
+        self.statement_seconds = Counter()
+
+    def record(self, statement, seconds):
+        key = normalize_statement(statement)
+        self.query_count += 1
+        self.db_seconds += seconds
+        self.statements[key] += 1
+        self.statement_seconds[key] += seconds
+
+    def top_statements(self, limit=SQL_PROFILE_TOP):
+        return [{
+            'statement': statement[:300],
+            'count': count,
+            'db_ms': round(self.statement_seconds[statement] * 1000, 2)
+        } for statement, count in self.statements.most_common(limit)]
+
+
+def _current_profile():
+    if has_request_context():
+        return g.get('sql_profile')
+    return None
+
+
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    profile = _current_profile()
+    if starts and profile is not None:
+        profile.record(statement, time.perf_counter() - starts.pop())
+
+
+def _finish(profile, route, method, status):
+    """Called once the response body has been sent"""
+    duration_ms = (time.perf_counter() - profile.start) * 1000
+    record = {
+        'route': route,
+        'method': method,
+        'status': status,
+        'duration_ms': round(duration_ms, 1),
+        'queries': profile.query_count,
+        'db_ms': round(profile.db_seconds * 1000, 1),
+        'top_statements': profile.top_statements(),
+        'slow': duration_ms >= SLOW_REQUEST_MS or profile.query_count >= SLOW_REQUEST_QUERIES,
+        'at': time.time(),
+    }
+    with _recent_lock:
+        _recent.append(record)
+    if record['slow']:
+        logger.warning(f"Slow request {json.dumps(record)}")
+
+
+def recent_profiles(slow_only=False):
+    """Profiles of the last requests handled by this process, newest first"""
+    with _recent_lock:
+        records = list(_recent)
+    return [record for record in reversed(records) if record['slow'] or not slow_only]
+
+
+def init_app(app):
+    """Profile every request of a Flask app when SQL_PROFILING=1"""
+    if not SQL_PROFILING:
+        return
+    logger.info(f"SQL profiling enabled (slow request: {SLOW_REQUEST_MS:g} ms or {SLOW_REQUEST_QUERIES} queries)")
+    if not event.contains(Engine, 'after_cursor_execute', _query_finished):
+        event.listen(Engine, 'after_cursor_execute', _query_finished)
+
+    @app.before_request
+    def _start_profile():
+        g.sql_profile = RequestProfile()
+        g.time_queries = True
+
+    @app.after_request
+    def _add_profile_headers(response):
+        profile = g.get('sql_profile')
+        if profile is None:
+            return response
+        response.headers['X-SQL-Queries'] = str(profile.query_count)
+        response.headers.add('Server-Timing', f'db;dur={profile.db_seconds * 1000:.1f};desc="{profile.query_count} queries"')
+        # Finished when the body is closed, so queries of streamed responses are included
+        route = request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+        method, status = request.method, response.status_code
+        response.call_on_close(lambda: _finish(profile, route, method, status))
+        return response
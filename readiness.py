@@ -0,0 +1,104 @@
+import os
+import time
+import shutil
+import logging
+import threading
+from sqlalchemy import select, func, text
+from app import app, db
+from models import ProcessingJob
+from audio_processor import vad_model_loaded
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two refreshes of the readiness snapshot
+READINESS_REFRESH_SECONDS = float(os.environ.get("READINESS_REFRESH_SECONDS", 10))
+# A snapshot older than this means the refresher is stuck (e.g. on an unreachable database)
+READINESS_MAX_AGE = float(os.environ.get("READINESS_MAX_AGE", 3 * READINESS_REFRESH_SECONDS))
+# Free space under UPLOAD_FOLDER below which uploads would fail
+READINESS_MIN_FREE_BYTES = int(os.environ.get("READINESS_MIN_FREE_MB", 512)) * 1024 * 1024
+# With WEB_VAD_PRELOAD=1 the model is loaded in every web worker, so it must be ready too
+READINESS_REQUIRE_VAD = os.environ.get("WEB_VAD_PRELOAD") == "1"
+
+_snapshot = None
+_monitor_lock = threading.Lock()
+_monitor_pid = None
+
+
+def collect_readiness():
+    """
+    Check the dependencies a web worker needs: a database connection from the
+    pool, free disk space for uploads and (if preloaded) the VAD model. Also
+    records the pool status and job queue depth for operators.
+    """
+    checks = {'database': False, 'queue_depth': None}
+    start_time = time.perf_counter()
+    with app.app_context():
+        try:
+            with db.engine.connect() as conn:
+                conn.execute(text('SELECT 1'))
+                checks['queue_depth'] = conn.execute(
+                    select(func.count(ProcessingJob.id)).where(ProcessingJob.status == 'pending')
+                ).scalar()
+            checks['database'] = True
+        except Exception as e:
+            logger.warning(f"Readiness check - database error: {str(e)}")
+        checks['pool'] = db.engine.pool.status()
+
+    try:
+        checks['disk_free_bytes'] = shutil.disk_usage(app.config['UPLOAD_FOLDER']).free
+    except OSError as e:
+        logger.warning(f"Readiness check - cannot stat {app.config['UPLOAD_FOLDER']}: {str(e)}")
+        checks['disk_free_bytes'] = None
+    checks['vad_model_loaded'] = vad_model_loaded()
+
+    ready = (checks['database']
+             and checks['disk_free_bytes'] is not None
+             and checks['disk_free_bytes'] >= READINESS_MIN_FREE_BYTES
+             and (checks['vad_model_loaded'] or not READINESS_REQUIRE_VAD))
+    checks['check_seconds'] = round(time.perf_counter() - start_time, 3)
+    return {'ready': bool(ready), 'checked_at': time.time(), 'checks': checks}
+
+
+def _refresh_forever():
+    global _snapshot
+    while True:
+        try:
+            _snapshot = collect_readiness()
+        except Exception as e:
+            logger.error(f"Readiness refresh failed: {str(e)}")
+        time.sleep(READINESS_REFRESH_SECONDS)
+
+
+def ensure_readiness_monitor():
+    """
+    Start the background refresher in this process. Threads do not survive
+    fork(), so every gunicorn worker starts its own in post_fork
+    (gunicorn.conf.py); other servers start it on the first probe.
+    """
+    global _monitor_pid, _snapshot
+    if _monitor_pid == os.getpid():
+        return
+    with _monitor_lock:
+        if _monitor_pid != os.getpid():
+            _snapshot = None  # Inherited from the parent, which no longer refreshes it for us
+            threading.Thread(target=_refresh_forever, name='readiness-monitor', daemon=True).start()
+            _monitor_pid = os.getpid()
+
+
+def readiness_status():
+    """
+    (ready, details) from the latest snapshot, without doing any I/O.
+    Not ready until the first snapshot exists or once it has gone stale.
+    """
+    ensure_readiness_monitor()
+    snapshot = _snapshot
+    if snapshot is None:
+        return False, {'status': 'starting'}
+
+    age = time.time() - snapshot['checked_at']
+    ready = snapshot['ready'] and age <= READINESS_MAX_AGE
+    return ready, {
+        'status': 'ready' if ready else 'not ready',
+        'snapshot_age_seconds': round(age, 1),
+        **snapshot['checks']
+    }
@@ -0,0 +1,357 @@
+import os
+import numpy as np
+
+# Silero VAD scores audio in fixed-size frames (512 samples at 16 kHz, 256 at 8 kHz)
+VAD_FRAME_SAMPLES = 512
+
+# Segmentation parameters used unless an admin re-segments a recording with others.
+# Clips are capped at Whisper's 30 second input window (padding included), since
+# the trainer truncates anything longer; shorter neighbouring clips are packed
+# together until they reach min_clip_duration_s.
+DEFAULT_VAD_PARAMS = {
+    'threshold': 0.5,
+    'neg_threshold': None,
+    'min_speech_duration_ms': 250,
+    'min_silence_duration_ms': 100,
+    'speech_pad_ms': 30,
+    'max_speech_duration_s': float(os.environ.get("VAD_MAX_SPEECH_SECONDS", 30)),
+    'min_clip_duration_s': float(os.environ.get("VAD_MIN_CLIP_SECONDS", 1.0)),
+    'pack_max_gap_ms': int(os.environ.get("VAD_PACK_MAX_GAP_MS", 500)),
+}
+
+
+def frame_samples_for(sampling_rate):
+    """Number of audio samples per VAD frame for a given sample rate"""
+    return VAD_FRAME_SAMPLES if sampling_rate == 16000 else 256
+
+
+def hysteresis_mask(probs, threshold=0.5, neg_threshold=None, initial=False):
+    """
+    Turn a per-frame speech probability track into a boolean speech mask.
+
+    A frame switches speech on when its probability reaches `threshold` and only
+    switches it off again once the probability drops below `neg_threshold`, so
+    probabilities hovering around a single cut-off do not produce flickering
+    regions. `initial` is the state before the first frame (used to carry state
+    across windows when the track is processed in pieces).
+    """
+    probs = np.asarray(probs, dtype=np.float32)
+    if neg_threshold is None:
+        neg_threshold = max(threshold - 0.15, 0.01)
+
+    # -1 = no event, 0 = switch off, 1 = switch on
+    events = np.full(len(probs), -1, dtype=np.int8)
+    events[probs < neg_threshold] = 0
+    events[probs >= threshold] = 1
+
+    # Forward-fill the most recent event to every frame
+    last_event = np.where(events >= 0, np.arange(len(probs)), -1)
+    np.maximum.accumulate(last_event, out=last_event)
+    return np.where(last_event >= 0, events[np.maximum(last_event, 0)] == 1, initial)
+
+
+def mask_to_regions(mask):
+    """Return (starts, ends) frame indices of the True runs in a mask; ends are exclusive"""
+    edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def merge_regions(starts, ends, min_gap):
+    """Merge neighbouring regions separated by fewer than `min_gap` frames"""
+    if len(starts) == 0:
+        return starts, ends
+    keep_break = (starts[1:] - ends[:-1]) >= min_gap
+    return (np.concatenate((starts[:1], starts[1:][keep_break])),
+            np.concatenate((ends[:-1][keep_break], ends[-1:])))
+
+
+def max_region_frames(max_speech_duration_s, sampling_rate, frame_samples, pad_samples=0):
+    """Longest region, in frames, whose padded clip still fits in max_speech_duration_s"""
+    if not max_speech_duration_s:
+        return None
+    return max(int((max_speech_duration_s * sampling_rate - 2 * pad_samples) // frame_samples), 2)
+
+
+def pack_regions(starts, ends, max_frames=None, min_frames=0, max_gap=0):
+    """
+    Pack short neighbouring regions together.
+    A region shorter than `min_frames` is joined with the next one when the
+    silence between them is at most `max_gap` frames and the packed region stays
+    within `max_frames`; packing continues until the region is long enough.
+    """
+    if len(starts) < 2 or not min_frames:
+        return starts, ends
+    if not np.any(ends - starts < min_frames):
+        return starts, ends
+
+    gaps = (starts[1:] - ends[:-1]).tolist()
+    packed_starts, packed_ends = [int(starts[0])], [int(ends[0])]
+    for i, (start, end) in enumerate(zip(starts[1:].tolist(), ends[1:].tolist())):
+        short = packed_ends[-1] - packed_starts[-1] < min_frames or end - start < min_frames
+        if short and gaps[i] <= max_gap and (max_frames is None or end - packed_starts[-1] <= max_frames):
+            packed_ends[-1] = end
+        else:
+            packed_starts.append(start)
+            packed_ends.append(end)
+    return np.array(packed_starts, dtype=starts.dtype), np.array(packed_ends, dtype=ends.dtype)
+
+
+def split_long_regions(probs, starts, ends, max_frames):
+    """
+    Split regions longer than `max_frames` at their least speech-like frame.
+    Each cut is searched in the second half of the allowed length, so no piece
+    becomes shorter than half the maximum unless the region itself is. All long
+    regions are cut at once: every round takes the argmin over a fixed-width
+    window of each remaining tail.
+    """
+    if max_frames is None or len(starts) == 0 or np.all(ends - starts <= max_frames):
+        return starts, ends
+    probs = np.asarray(probs, dtype=np.float32)
+    min_piece = max(max_frames // 2, 1)
+    window = np.arange(max_frames - min_piece)
+
+    split_starts, split_ends = [], []
+    starts, ends = starts.astype(np.int64), ends.astype(np.int64)
+    while len(starts):
+        long = ends - starts > max_frames
+        split_starts.append(starts[~long])
+        split_ends.append(ends[~long])
+        starts, ends = starts[long], ends[long]
+        if len(starts):
+            cuts = starts + min_piece + np.argmin(probs[(starts + min_piece)[:, None] + window], axis=1)
+            split_starts.append(starts)
+            split_ends.append(cuts)
+            starts = cuts
+
+    split_starts = np.concatenate(split_starts)
+    order = np.argsort(split_starts, kind='stable')
+    return split_starts[order], np.concatenate(split_ends)[order]
+
+
+def regions_to_timestamps(starts, ends, frame_samples, pad_samples=0, total_samples=None):
+    """
+    Convert frame regions to sample offsets, adding padding on both sides.
+    Where padding would make two neighbouring segments overlap, the gap is
+    split in the middle instead.
+    """
+    start_samples = np.asarray(starts, dtype=np.int64) * frame_samples - pad_samples
+    end_samples = np.asarray(ends, dtype=np.int64) * frame_samples + pad_samples
+
+    if len(start_samples) > 1:
+        overlap = start_samples[1:] < end_samples[:-1]
+        middle = (np.asarray(ends[:-1], dtype=np.int64) + np.asarray(starts[1:], dtype=np.int64)) * frame_samples // 2
+        end_samples[:-1] = np.where(overlap, middle, end_samples[:-1])
+        start_samples[1:] = np.where(overlap, middle, start_samples[1:])
+
+    np.maximum(start_samples, 0, out=start_samples)
+    if total_samples is not None:
+        np.minimum(end_samples, total_samples, out=end_samples)
+    return [{'start': int(s), 'end': int(e)} for s, e in zip(start_samples, end_samples)]
+
+
+def speech_regions_from_probs(probs, sampling_rate=16000, frame_samples=None, threshold=0.5,
+                              neg_threshold=None, min_speech_duration_ms=250,
+                              min_silence_duration_ms=100, speech_pad_ms=30, total_samples=None,
+                              max_speech_duration_s=None, min_clip_duration_s=0, pack_max_gap_ms=0):
+    """
+    Extract speech segments from a per-frame speech probability track.
+
+    Everything runs as whole-array operations: hysteresis thresholding, edge
+    detection on the resulting mask, merging across short silences, minimum
+    duration filtering and padding. Segments whose padded length would exceed
+    max_speech_duration_s are split at their least speech-like frame, then
+    segments shorter than min_clip_duration_s are packed with their neighbours.
+    Returns a list of {'start': ..., 'end': ...} dicts in samples.
+    """
+    frame_samples = frame_samples or frame_samples_for(sampling_rate)
+    frames_per_ms = sampling_rate / frame_samples / 1000
+    pad_samples = int(sampling_rate * speech_pad_ms / 1000)
+    max_frames = max_region_frames(max_speech_duration_s, sampling_rate, frame_samples, pad_samples)
+
+    mask = hysteresis_mask(probs, threshold, neg_threshold)
+    starts, ends = mask_to_regions(mask)
+    starts, ends = merge_regions(starts, ends, int(np.ceil(min_silence_duration_ms * frames_per_ms)))
+
+    long_enough = (ends - starts) >= min_speech_duration_ms * frames_per_ms
+    starts, ends = starts[long_enough], ends[long_enough]
+    starts, ends = split_long_regions(probs, starts, ends, max_frames)
+    starts, ends = pack_regions(starts, ends, max_frames, int((min_clip_duration_s or 0) * 1000 * frames_per_ms),
+                                int((pack_max_gap_ms or 0) * frames_per_ms))
+    return regions_to_timestamps(starts, ends, frame_samples, pad_samples, total_samples)
+
+
+class StreamingRegionTracker:
+    """
+    Incremental version of speech_regions_from_probs for probability tracks that
+    arrive in pieces (one decode window at a time).
+
+    Hysteresis state, the currently open region and the last closed region (which
+    may still be merged with the next one) are carried across calls to push(), so
+    segments are never split at window edges. Regions are returned as soon as no
+    later frame can change them, as (start_frame, end_frame) tuples.
+
+    Long regions are split and short ones packed as in the batch version; the
+    probabilities of frames that may still belong to a returned region are kept
+    for that. A region that keeps growing past max_frames has its head cut off
+    as soon as the cut is known, and a short region waiting to be packed is
+    released after max_frames, so the frames (and audio) a caller must keep stay
+    bounded by the maximum clip length plus one chunk. The only difference from
+    the batch version: a short region is not packed with the first piece of a
+    long region that follows it.
+    """
+
+    def __init__(self, sampling_rate=16000, frame_samples=None, threshold=0.5, neg_threshold=None,
+                 min_speech_duration_ms=250, min_silence_duration_ms=100, speech_pad_ms=30,
+                 max_speech_duration_s=None, min_clip_duration_s=0, pack_max_gap_ms=0):
+        self.frame_samples = frame_samples or frame_samples_for(sampling_rate)
+        frames_per_ms = sampling_rate / self.frame_samples / 1000
+        self.threshold = threshold
+        self.neg_threshold = neg_threshold
+        self.min_speech_frames = min_speech_duration_ms * frames_per_ms
+        self.min_gap_frames = int(np.ceil(min_silence_duration_ms * frames_per_ms))
+        self.max_frames = max_region_frames(max_speech_duration_s, sampling_rate, self.frame_samples,
+                                            int(sampling_rate * speech_pad_ms / 1000))
+        self.min_clip_frames = int((min_clip_duration_s or 0) * 1000 * frames_per_ms)
+        self.pack_gap_frames = int((pack_max_gap_ms or 0) * frames_per_ms)
+
+        self.frames_seen = 0
+        self.in_speech = False
+        self.open_start = None
+        self.pending = None  # Last closed region, still mergeable with the next one
+        self.held = None  # Last finalized region, still packable with the next one
+        self.continued = False  # The active region is the tail of a cut region (kept whatever its length)
+        self.probs = np.zeros(0, dtype=np.float32)
+        self.probs_offset = 0  # Frame index of probs[0]
+
+    def push(self, probs):
+        """Feed the next chunk of frame probabilities; returns the regions finalized by it"""
+        probs = np.asarray(probs, dtype=np.float32)
+        if len(probs) == 0:
+            return []
+        offset = self.frames_seen
+        self.probs = np.concatenate((self.probs, probs))
+
+        mask = hysteresis_mask(probs, self.threshold, self.neg_threshold, initial=self.in_speech)
+        starts, ends = mask_to_regions(mask)
+        starts = starts + offset
+        ends = ends + offset
+
+        closed = []
+        if self.in_speech:
+            if mask[0]:
+                # The region open at the end of the previous chunk continues
+                starts[0] = self.open_start
+            else:
+                closed.append((self.open_start, offset))
+
+        if mask[-1]:
+            self.open_start = int(starts[-1])
+            starts, ends = starts[:-1], ends[:-1]
+        else:
+            self.open_start = None
+        closed.extend(zip(starts.tolist(), ends.tolist()))
+
+        self.in_speech = bool(mask[-1])
+        self.frames_seen += len(probs)
+        finalized = self._merge(closed, final=False)
+        finalized.extend(self._cut_long_region())
+        regions = self._shape(finalized, final=False)
+
+        # Keep only the probabilities of frames a later region can still reach
+        keep_from = self.earliest_active_frame()
+        self.probs = self.probs[keep_from - self.probs_offset:]
+        self.probs_offset = keep_from
+        return regions
+
+    def finish(self):
+        """Close the stream and return the remaining regions"""
+        closed = []
+        if self.in_speech:
+            closed.append((self.open_start, self.frames_seen))
+            self.in_speech = False
+            self.open_start = None
+        return self._shape(self._merge(closed, final=True), final=True)
+
+    def earliest_active_frame(self):
+        """First frame that may still become part of a region that has not been returned yet"""
+        candidates = [self.frames_seen]
+        if self.held is not None:
+            candidates.append(self.held[0])
+        if self.pending is not None:
+            candidates.append(self.pending[0])
+        if self.open_start is not None:
+            candidates.append(self.open_start)
+        return min(candidates)
+
+    def _cut_long_region(self):
+        """
+        Cut the head off the active region (pending, possibly merged with the open
+        one) while it is known to be longer than max_frames. The cut is the one
+        split_long_regions would make, as it only depends on the first max_frames.
+        """
+        cuts = []
+        if self.max_frames is None:
+            return cuts
+        min_piece = max(self.max_frames // 2, 1)
+        while self.pending is not None or self.in_speech:
+            start = self.pending[0] if self.pending is not None else self.open_start
+            known_end = self.frames_seen if self.in_speech else self.pending[1]
+            if known_end - start <= self.max_frames or known_end - start < self.min_speech_frames:
+                break
+            window = self.probs[start + min_piece - self.probs_offset:start + self.max_frames - self.probs_offset]
+            cut = start + min_piece + int(np.argmin(window))
+            cuts.append((start, cut))
+            if self.pending is not None and cut < self.pending[1]:
+                self.pending = (cut, self.pending[1])
+            else:
+                self.pending = None
+                self.open_start = cut
+            self.continued = True
+        return cuts
+
+    def _merge(self, closed, final):
+        finalized = []
+        for start, end in closed:
+            if self.pending is not None and start - self.pending[1] < self.min_gap_frames:
+                self.pending = (self.pending[0], end)
+            else:
+                self._emit(finalized)
+                self.pending = (start, end)
+
+        # The pending region is final once nothing can be merged into it anymore
+        next_start = self.open_start if self.open_start is not None else self.frames_seen
+        if self.pending is not None and (final or next_start - self.pending[1] >= self.min_gap_frames):
+            self._emit(finalized)
+        return finalized
+
+    def _emit(self, finalized):
+        if self.pending is not None:
+            if self.continued or self.pending[1] - self.pending[0] >= self.min_speech_frames:
+                finalized.append(self.pending)
+            self.continued = False
+        self.pending = None
+
+    def _shape(self, finalized, final):
+        """Split long finalized regions and pack short ones, holding back the last one while it may still grow"""
+        if self.held is not None:
+            finalized.insert(0, self.held)
+            self.held = None
+        if not finalized:
+            return []
+
+        starts = np.array([start for start, _ in finalized], dtype=np.int64)
+        ends = np.array([end for _, end in finalized], dtype=np.int64)
+        starts, ends = split_long_regions(self.probs, starts - self.probs_offset, ends - self.probs_offset,
+                                          self.max_frames)
+        starts, ends = pack_regions(starts + self.probs_offset, ends + self.probs_offset, self.max_frames,
+                                    self.min_clip_frames, self.pack_gap_frames)
+
+        # A region starting within the packing gap may still be packed into the last one.
+        # It is held back for at most max_frames, which bounds the frames callers keep; a
+        # long next region whose first piece would only be known later is not packed with it.
+        if (not final and self.min_clip_frames
+                and self.earliest_active_frame() - ends[-1] <= self.pack_gap_frames
+                and (self.max_frames is None or self.frames_seen - starts[-1] < self.max_frames)):
+            self.held = (int(starts[-1]), int(ends[-1]))
+            starts, ends = starts[:-1], ends[:-1]
+        return list(zip(starts.tolist(), ends.tolist()))
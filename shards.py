@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+"""
+Sharded dataset export for training pipelines.
+
+Writes the approved transcriptions as WebDataset-style tar shards: each sample
+is stored as consecutive `<key>.<ext>` (audio), `<key>.txt` (transcription)
+and `<key>.json` (metadata) members, and a shard is closed once it reaches
+--samples-per-shard samples or --shard-size bytes of audio. Samples are split
+into train / validation deterministically (by a seeded hash of the audio file,
+so all clips of one recording land on the same side) and shards are written in
+parallel worker processes. A columnar manifest.parquet lists every sample
+with its shard, duration, sample rate, transcriber, audio_id and text.
+pyarrow is a dependency for it; an environment installed without it gets
+manifest.jsonl (one JSON object per sample) instead, with a warning.
+
+Usage:
+    python shards.py --output exports/shards [--val-fraction 0.05] [--processes 4]
+"""
+
+import os
+import io
+import re
+import sys
+import json
+import wave
+import time
+import shutil
+import hashlib
+import logging
+import tarfile
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from app import db
+from models import Clip, Transcription, User
+from audio_processor import clip_format, materialize_clip_wav, resolve_clip_path
+
+logger = logging.getLogger(__name__)
+
+PYARROW_AVAILABLE = False
+pa = None
+pq = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    logger.warning("pyarrow not available, shard manifests will be written as manifest.jsonl "
+                   "instead of manifest.parquet")
+
+SHARD_SAMPLES = int(os.environ.get("SHARD_SAMPLES", 1000))
+SHARD_MAX_BYTES = int(os.environ.get("SHARD_MAX_BYTES", 512 * 1024 * 1024))
+SPLITS = ('train', 'validation')
+
+# Files an export writes; removed from the output directory when it is exported again
+EXPORT_FILE_PATTERN = re.compile(r'^(?:(?:train|validation)-\d+\.tar|manifest\.(?:parquet|jsonl)|shards\.json)$')
+
+MANIFEST_COLUMNS = ['key', 'split', 'shard', 'clip_id', 'audio_id', 'transcriber',
+                    'text', 'duration', 'sample_rate', 'audio_format']
+
+
+def split_for(value, val_fraction, seed=0):
+    """'validation' for a stable val_fraction share of values, 'train' for the rest"""
+    digest = hashlib.sha256(f"{seed}:{value}".encode('utf-8')).digest()
+    return 'validation' if int.from_bytes(digest[:8], 'big') / 2 ** 64 < val_fraction else 'train'
+
+
+def _sample_order(seed, clip_id):
+    """Deterministic shuffle key, so neighbouring clips of a recording are spread over shards"""
+    return hashlib.sha256(f"{seed}:order:{clip_id}".encode('utf-8')).digest()
+
+
+def _exported_size(path, audio_format, duration, sample_rate, span):
+    """Bytes the clip's audio takes up in a shard"""
+    if span is not None:
+        return (span[1] - span[0]) * 2 + 44
+    if audio_format == 'wav' and clip_format(path) != 'wav' and duration and sample_rate:
+        # Converted to 16-bit mono WAV; estimated from the recorded duration
+        return int(duration * sample_rate) * 2 + 44
+    return os.path.getsize(path)
+
+
+def collect_samples(val_fraction=0.05, split_by='audio', seed=0, audio_format='wav'):
+    """
+    Approved transcriptions as plain sample dicts, grouped by split.
+    Read with one query; clips whose file is missing are skipped.
+    """
+    rows = db.session.query(Clip.id, Clip.audio_id, Clip.order, Clip.path, Clip.duration, Clip.sample_rate,
+                            Clip.virtual, Clip.start_sample, Clip.end_sample, Transcription.text, User.username) \
+        .join(Transcription, Transcription.clip_id == Clip.id) \
+        .outerjoin(User, User.id == Transcription.transcriber_id) \
+        .filter(Transcription.status == 'approved') \
+        .order_by(Clip.audio_id, Clip.order) \
+        .yield_per(1000)
+
+    samples = {split: [] for split in SPLITS}
+    for clip_id, audio_id, order, clip_path, duration, sample_rate, virtual, start, end, text, transcriber in rows:
+        path = resolve_clip_path(clip_path)
+        if path is None:
+            logger.warning(f"Shard export: clip file not found, skipping: {clip_path}")
+            continue
+        span = (start, end) if virtual else None
+        split = split_for(audio_id if split_by == 'audio' else clip_id, val_fraction, seed)
+        samples[split].append({
+            'key': f"{audio_id:06d}_{order:06d}",
+            'clip_id': clip_id,
+            'audio_id': audio_id,
+            'transcriber': transcriber,
+            'text': text,
+            'path': path,
+            'span': span,
+            'duration': duration,
+            'sample_rate': sample_rate,
+            'size': _exported_size(path, audio_format, duration, sample_rate, span),
+        })
+
+    for split in SPLITS:
+        samples[split].sort(key=lambda sample: _sample_order(seed, sample['clip_id']))
+    return samples
+
+
+def plan_shards(samples, samples_per_shard=SHARD_SAMPLES, max_bytes=SHARD_MAX_BYTES):
+    """
+    Cut an ordered sample list into shards of at most samples_per_shard samples
+    and about max_bytes of audio. Compressed clips exported as WAV are sized
+    from their recorded duration (their file size when it is unknown).
+    """
+    shards = []
+    current, current_bytes = [], 0
+    for sample in samples:
+        if current and (len(current) >= samples_per_shard or current_bytes + sample['size'] > max_bytes):
+            shards.append(current)
+            current, current_bytes = [], 0
+        current.append(sample)
+        current_bytes += sample['size']
+    if current:
+        shards.append(current)
+    return shards
+
+
+def _wav_info(data):
+    """
+    (duration in seconds, sample rate) of WAV bytes. The duration is computed
+    from the sample data actually present, not from the header's frame count.
+    """
+    with wave.open(io.BytesIO(data)) as wav:
+        frame_size = wav.getsampwidth() * wav.getnchannels()
+        frame_count = len(wav.readframes(wav.getnframes())) // frame_size
+        return frame_count / wav.getframerate(), wav.getframerate()
+
+
+def _add_member(tar, name, data):
+    # Fixed metadata so the same samples always produce byte-identical shards
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mode = 0o644
+    info.mtime = 0
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_shard(shard_path, samples, split, audio_format='wav'):
+    """
+    Write one tar shard and return its manifest rows. Runs in a worker process
+    and only touches the filesystem. The shard is written under a temporary
+    name and renamed into place when complete.
+    """
+    shard_name = os.path.basename(shard_path)
+    tmp_path = shard_path + '.partial'
+    rows = []
+    try:
+        with tarfile.open(tmp_path, 'w', format=tarfile.USTAR_FORMAT) as tar:
+            for sample in samples:
+                wav_data = materialize_clip_wav(sample['path'], sample['span'])
+                # Clips segmented by this app have their duration recorded; older ones are measured
+                duration, sample_rate = sample['duration'], sample['sample_rate']
+                if not duration or not sample_rate:
+                    duration, sample_rate = _wav_info(wav_data)
+                if audio_format == 'original' and sample['span'] is None and clip_format(sample['path']) != 'wav':
+                    with open(sample['path'], 'rb') as f:
+                        audio_data = f.read()
+                    extension = clip_format(sample['path'])
+                else:
+                    audio_data, extension = wav_data, 'wav'
+
+                row = {
+                    'key': sample['key'],
+                    'split': split,
+                    'shard': shard_name,
+                    'clip_id': sample['clip_id'],
+                    'audio_id': sample['audio_id'],
+                    'transcriber': sample['transcriber'],
+                    'text': sample['text'],
+                    'duration': round(duration, 3),
+                    'sample_rate': sample_rate,
+                    'audio_format': extension,
+                }
+                _add_member(tar, f"{sample['key']}.{extension}", audio_data)
+                _add_member(tar, f"{sample['key']}.txt", sample['text'].encode('utf-8'))
+                _add_member(tar, f"{sample['key']}.json", json.dumps(
+                    {column: row[column] for column in MANIFEST_COLUMNS if column not in ('key', 'shard')},
+                    ensure_ascii=False).encode('utf-8'))
+                rows.append(row)
+        os.replace(tmp_path, shard_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return rows
+
+
+def write_manifest(rows, output_dir):
+    """Write the manifest as manifest.parquet, or manifest.jsonl without pyarrow. Returns its path."""
+    if PYARROW_AVAILABLE:
+        schema = pa.schema([
+            ('key', pa.string()),
+            ('split', pa.string()),
+            ('shard', pa.string()),
+            ('clip_id', pa.int64()),
+            ('audio_id', pa.int64()),
+            ('transcriber', pa.string()),
+            ('text', pa.string()),
+            ('duration', pa.float64()),
+            ('sample_rate', pa.int32()),
+            ('audio_format', pa.string()),
+        ])
+        table = pa.Table.from_pylist(rows, schema=schema)
+        path = os.path.join(output_dir, 'manifest.parquet')
+        pq.write_table(table, path)
+        return path
+
+    path = os.path.join(output_dir, 'manifest.jsonl')
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, ensure_ascii=False) + '\n')
+    return path
+
+
+def shard_urls(split, shard_names):
+    """
+    Brace pattern accepted by webdataset.WebDataset() for the shards of a split,
+    or the list of shard names when their numbers have gaps
+    """
+    if not shard_names:
+        return None
+    numbers = sorted(int(name[len(split) + 1:-len('.tar')]) for name in shard_names)
+    if numbers != list(range(numbers[0], numbers[-1] + 1)):
+        return sorted(shard_names)
+    return f"{split}-{{{numbers[0]:06d}..{numbers[-1]:06d}}}.tar"
+
+
+def _replace_export(staging_dir, output_dir):
+    """Move a finished export into output_dir, removing the files of the previous one"""
+    for name in os.listdir(output_dir):
+        if EXPORT_FILE_PATTERN.match(name):
+            os.remove(os.path.join(output_dir, name))
+    for name in os.listdir(staging_dir):
+        os.replace(os.path.join(staging_dir, name), os.path.join(output_dir, name))
+
+
+def export_shards(output_dir, val_fraction=0.05, split_by='audio', seed=0, processes=None,
+                  samples_per_shard=SHARD_SAMPLES, max_bytes=SHARD_MAX_BYTES, audio_format='wav'):
+    """
+    Export the approved dataset as train / validation tar shards plus a manifest.
+    Must be called inside an application context. The export is written to a
+    staging directory next to output_dir and replaces the previous export's
+    files only once complete.
+
+    Returns:
+        dict: the summary also written to shards.json
+    """
+    start_time = time.time()
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    samples = collect_samples(val_fraction, split_by, seed, audio_format)
+    staging_dir = tempfile.mkdtemp(prefix=f".{os.path.basename(output_dir)}-", dir=os.path.dirname(output_dir))
+    try:
+        summary, shard_count, sample_count = _write_export(staging_dir, samples, val_fraction, split_by, seed,
+                                                           processes, samples_per_shard, max_bytes, audio_format)
+        _replace_export(staging_dir, output_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+    logger.info(f"Exported {sample_count} samples in {shard_count} shards to {output_dir} "
+                f"in {time.time() - start_time:.1f}s")
+    return summary
+
+
+def _write_export(output_dir, samples, val_fraction, split_by, seed, processes, samples_per_shard, max_bytes,
+                  audio_format):
+    tasks = []
+    for split in SPLITS:
+        for i, shard_samples in enumerate(plan_shards(samples[split], samples_per_shard, max_bytes)):
+            tasks.append((os.path.join(output_dir, f"{split}-{i:06d}.tar"), shard_samples, split))
+
+    # Workers only read clip files, so the parent's connections must not leak into them
+    db.engine.dispose()
+    processes = processes or os.cpu_count() or 1
+    context = multiprocessing.get_context("fork")
+    rows = []
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [executor.submit(write_shard, path, shard_samples, split, audio_format)
+                   for path, shard_samples, split in tasks]
+        for future in futures:
+            rows.extend(future.result())
+
+    manifest_path = write_manifest(rows, output_dir)
+    summary = {
+        'manifest': os.path.basename(manifest_path),
+        'split_by': split_by,
+        'val_fraction': val_fraction,
+        'seed': seed,
+        'splits': {},
+    }
+    for split in SPLITS:
+        split_rows = [row for row in rows if row['split'] == split]
+        # Shards that were actually written, whatever the plan was
+        shard_names = sorted({row['shard'] for row in split_rows})
+        summary['splits'][split] = {
+            'shards': shard_names,
+            'urls': shard_urls(split, shard_names),
+            'samples': len(split_rows),
+            'hours': round(sum(row['duration'] for row in split_rows) / 3600, 3),
+        }
+    with open(os.path.join(output_dir, 'shards.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+    return summary, len(tasks), len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export approved transcriptions as tar shards for training")
+    parser.add_argument('--output', required=True, help="Directory to write the shards and manifest to")
+    parser.add_argument('--val-fraction', type=float, default=0.05,
+                        help="Share of the data that goes to the validation split")
+    parser.add_argument('--split-by', choices=['audio', 'clip'], default='audio',
+                        help="Split whole recordings (default) or individual clips")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the split and sample order")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="Shard writer processes (default: number of CPUs)")
+    parser.add_argument('--samples-per-shard', type=int, default=SHARD_SAMPLES)
+    parser.add_argument('--shard-size', type=int, default=SHARD_MAX_BYTES // (1024 * 1024),
+                        help="Target audio megabytes per shard")
+    parser.add_argument('--audio-format', choices=['wav', 'original'], default='wav',
+                        help="Store WAV (default) or the clips' stored format")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] %(levelname)s - %(message)s')
+    from app import app
+    with app.app_context():
+        summary = export_shards(args.output, args.val_fraction, args.split_by, args.seed, args.processes,
+                                args.samples_per_shard, args.shard_size * 1024 * 1024, args.audio_format)
+    print(json.dumps(summary['splits'], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -266,6 +266,29 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     });
     
+    // Poll segmentation status for audio files that are still queued or processing
+    const pendingAudioRows = document.querySelectorAll('tr[data-audio-status="pending"], tr[data-audio-status="processing"]');
+    if (pendingAudioRows.length > 0) {
+        const pollInterval = setInterval(() => {
+            pendingAudioRows.forEach(row => {
+                const audioId = row.getAttribute('data-audio-id');
+                
+                fetch(`/admin/audio/${audioId}/status`, { credentials: 'same-origin' })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status === 'processed' || data.status === 'error') {
+                        // Reload once so the row gets its action buttons
+                        clearInterval(pollInterval);
+                        window.location.reload();
+                    }
+                })
+                .catch(error => {
+                    console.error('Error polling audio status:', error);
+                });
+            });
+        }, 5000);
+    }
+    
     // Audio player in review page
     const reviewAudioPlayers = document.querySelectorAll('.review-audio-player');
     console.log(`Found ${reviewAudioPlayers.length} review audio players`);
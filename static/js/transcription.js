@@ -76,7 +76,12 @@ document.addEventListener("DOMContentLoaded", () => {
         clipItems.forEach(item => {
             item.addEventListener("click", function() {
                 const clipId = this.getAttribute("data-clip-id");
-                const clipUrl = this.getAttribute("data-clip-url");
+                let clipUrl = this.getAttribute("data-clip-url");
+                
+                // Ask for the smaller Opus copy when the browser can play it
+                if (audioPlayer && audioPlayer.canPlayType('audio/ogg; codecs=opus')) {
+                    clipUrl += '?format=opus';
+                }
                 
                 console.log(`Clicked clip: ${clipId}, URL: ${clipUrl}`);
                 
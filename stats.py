@@ -0,0 +1,176 @@
+import os
+import time
+import logging
+import threading
+from collections import defaultdict
+from sqlalchemy import event, select, update, insert, delete, func, literal, union_all, inspect
+from app import db
+from models import Clip, Transcription, StatusCounter
+
+logger = logging.getLogger(__name__)
+
+# Seconds a stats snapshot may be served before it is read again
+STATS_CACHE_TTL = float(os.environ.get("STATS_CACHE_TTL", 10))
+
+# Models whose status histograms are kept in the status_counter table
+TRACKED_MODELS = {Clip: 'clip', Transcription: 'transcription'}
+
+_stats_cache = {'value': None, 'expires': 0.0}
+_stats_cache_lock = threading.Lock()
+
+
+def status_histograms():
+    """
+    Count rows per status for every tracked table, in one grouped query.
+    Returns {'clip': {status: count}, 'transcription': {status: count}}.
+    """
+    query = union_all(*[
+        select(literal(entity).label('entity'), model.status, func.count(model.id))
+        .group_by(model.status)
+        for model, entity in TRACKED_MODELS.items()
+    ])
+    histograms = {entity: {} for entity in TRACKED_MODELS.values()}
+    for entity, status, count in db.session.execute(query):
+        if status is not None:
+            histograms[entity][status] = count
+    return histograms
+
+
+def rebuild_status_counters():
+    """Recompute the status_counter table from the tracked tables"""
+    histograms = status_histograms()
+    db.session.execute(delete(StatusCounter))
+    for entity, counts in histograms.items():
+        for status, count in counts.items():
+            db.session.add(StatusCounter(entity=entity, status=status, count=count))
+    db.session.commit()
+    invalidate_stats_cache()
+    logger.info(f"Rebuilt status counters: {histograms}")
+
+
+def ensure_status_counters():
+    """Fill the status_counter table on first start against an existing database"""
+    if db.session.query(StatusCounter).first() is None:
+        rebuild_status_counters()
+
+
+def status_counts():
+    """
+    Current {'clip': {...}, 'transcription': {...}} status counts.
+    Read from the counters table (a handful of rows) and cached for STATS_CACHE_TTL
+    seconds; commits that change a status invalidate this process's copy.
+    """
+    with _stats_cache_lock:
+        if _stats_cache['value'] is not None and time.monotonic() < _stats_cache['expires']:
+            return _stats_cache['value']
+
+    counts = {entity: {} for entity in TRACKED_MODELS.values()}
+    for counter in StatusCounter.query.all():
+        counts.setdefault(counter.entity, {})[counter.status] = counter.count
+
+    with _stats_cache_lock:
+        _stats_cache['value'] = counts
+        _stats_cache['expires'] = time.monotonic() + STATS_CACHE_TTL
+    return counts
+
+
+def invalidate_stats_cache():
+    with _stats_cache_lock:
+        _stats_cache['value'] = None
+
+
+def record_bulk_delete(query):
+    """
+    Account for rows about to be removed with a bulk Query.delete(), which
+    bypasses the flush hook below. Call it in the same transaction, before deleting.
+    """
+    model = query.column_descriptions[0]['entity']
+    entity = TRACKED_MODELS[model]
+    rows = query.with_entities(model.status, func.count(model.id)).group_by(model.status).all()
+    _apply_deltas(db.session, {(entity, status): -count for status, count in rows if status is not None})
+
+
+def record_status_changes(model, deltas):
+    """
+    Account for rows inserted or updated with bulk statements, which bypass the
+    flush hook below. `deltas` maps status -> change in row count.
+    """
+    entity = TRACKED_MODELS[model]
+    _apply_deltas(db.session, {(entity, status): delta for status, delta in deltas.items()})
+
+
+def _status_default(model):
+    default = model.__table__.c.status.default
+    return default.arg if default is not None else None
+
+
+def _committed_status(obj):
+    """Status of an object as currently stored in the database"""
+    history = inspect(obj).attrs.status.history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return obj.status
+
+
+def _apply_deltas(session, deltas):
+    """Add the (entity, status) -> delta changes to the counters, in the session's transaction"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    table = StatusCounter.__table__
+    conn = session.connection()
+    for (entity, status), delta in deltas.items():
+        result = conn.execute(
+            update(table)
+            .where(table.c.entity == entity, table.c.status == status)
+            .values(count=table.c.count + delta)
+        )
+        if result.rowcount == 0:
+            conn.execute(insert(table).values(entity=entity, status=status, count=delta))
+    session.info['status_changed'] = True
+
+
+@event.listens_for(db.session, 'before_flush')
+def _track_status_changes(session, flush_context, instances):
+    deltas = defaultdict(int)
+
+    for obj in session.new:
+        entity = TRACKED_MODELS.get(type(obj))
+        if entity:
+            status = obj.status if obj.status is not None else _status_default(type(obj))
+            deltas[(entity, status)] += 1
+
+    for obj in session.dirty:
+        entity = TRACKED_MODELS.get(type(obj))
+        if entity:
+            history = inspect(obj).attrs.status.history
+            if history.added and history.deleted:
+                deltas[(entity, history.deleted[0])] -= 1
+                deltas[(entity, history.added[0])] += 1
+
+    for obj in session.deleted:
+        entity = TRACKED_MODELS.get(type(obj))
+        if entity:
+            deltas[(entity, _committed_status(obj))] -= 1
+
+    _apply_deltas(session, {key: delta for key, delta in deltas.items() if key[1] is not None})
+
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('status_changed', False):
+        invalidate_stats_cache()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('status_changed', None)
+
+
+# Load the previous status when it is overwritten, even if the attribute was
+# expired by a commit, so the flush hook always sees both sides of a transition
+for _model in TRACKED_MODELS:
+    event.listen(_model.status, 'set', lambda target, value, oldvalue, initiator: value,
+                 active_history=True, retval=True)
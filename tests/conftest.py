@@ -0,0 +1,32 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads DATABASE_URL at import time, so point it at a scratch database first
+_workdir = tempfile.mkdtemp(prefix='hassni-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_workdir, 'test.sqlite')}"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import app as flask_app, db  # noqa: E402
+from init_db import initialize_database  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def app():
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False,
+                            UPLOAD_FOLDER=os.path.join(_workdir, 'clips'))
+    os.makedirs(flask_app.config['UPLOAD_FOLDER'], exist_ok=True)
+    initialize_database(fix_paths=False)
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin'})
+    return client
@@ -0,0 +1,34 @@
+"""Clips stored compressed must come back as WAV with a correct header"""
+
+import io
+import wave
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from audio_processor import materialize_wav, wav_header
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="FFmpeg is required")
+
+
+def _write_flac_clip(tmp_path, frame_count, sampling_rate=16000):
+    samples = (np.sin(np.arange(frame_count) * 2 * np.pi * 440 / sampling_rate) * 8000).astype('<i2')
+    wav_path = tmp_path / 'clip_1.wav'
+    wav_path.write_bytes(wav_header(frame_count, sampling_rate) + samples.tobytes())
+    flac_path = tmp_path / 'clip_1.flac'
+    subprocess.run(['ffmpeg', '-nostdin', '-v', 'error', '-i', str(wav_path), '-y', str(flac_path)], check=True)
+    return flac_path, samples
+
+
+def test_materialized_flac_has_correct_frame_count(tmp_path):
+    flac_path, samples = _write_flac_clip(tmp_path, 24000)
+
+    data = materialize_wav(str(flac_path))
+    with wave.open(io.BytesIO(data)) as wav:
+        assert wav.getnframes() == len(samples)
+        assert wav.getframerate() == 16000
+        assert wav.getnchannels() == 1
+        assert wav.getsampwidth() == 2
+        assert wav.readframes(wav.getnframes()) == samples.tobytes()
@@ -0,0 +1,64 @@
+"""The review endpoints must issue a fixed number of queries, however many clips an audio file has"""
+
+import pytest
+from sqlalchemy import event
+from app import db
+from models import User, Audio, Clip, Transcription
+
+
+def _create_audio(clip_count):
+    admin = User.query.filter_by(username='admin').one()
+    transcriber = User.query.filter_by(username='review-transcriber').first()
+    if transcriber is None:
+        transcriber = User(username='review-transcriber', email='review-transcriber@example.com',
+                           password_hash='-', role='transcriber')
+        db.session.add(transcriber)
+
+    audio = Audio(filename=f'{clip_count}-clips.wav', original_path='-', status='processed',
+                  uploader_id=admin.id, clip_count=clip_count)
+    db.session.add(audio)
+    db.session.flush()
+    for order in range(clip_count):
+        # Every other clip is transcribed, so both sides of the outer joins are exercised
+        transcribed = order % 2 == 0
+        clip = Clip(audio_id=audio.id, filename=f'clip_{order}.wav', path=f'clip_{order}.wav', order=order,
+                    status='submitted' if transcribed else 'unassigned',
+                    transcriber_id=transcriber.id if transcribed else None)
+        db.session.add(clip)
+        if transcribed:
+            db.session.flush()
+            db.session.add(Transcription(clip_id=clip.id, transcriber_id=transcriber.id,
+                                         text=f'clip {order}', status='submitted'))
+    db.session.commit()
+    return audio.id
+
+
+def _count_queries(app, client, url):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(url)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+
+@pytest.mark.parametrize('url', [
+    '/admin/review_audio/{audio_id}?per_page=200',
+    '/admin/review_audio/{audio_id}/clips?per_page=200',
+])
+def test_review_query_count_does_not_grow_with_clips(app, admin_client, url):
+    with app.app_context():
+        small_audio = _create_audio(5)
+        large_audio = _create_audio(200)
+
+    small = _count_queries(app, admin_client, url.format(audio_id=small_audio))
+    large = _count_queries(app, admin_client, url.format(audio_id=large_audio))
+    assert small == large
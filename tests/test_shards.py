@@ -0,0 +1,72 @@
+"""Sharded dataset export: sample metadata and manifests"""
+
+import json
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+import shards
+from app import db
+from audio_processor import wav_header
+from models import User, Audio, Clip, Transcription
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="FFmpeg is required")
+
+CLIP_FRAMES = {'wav': 16000, 'flac': 24000}
+
+
+@pytest.fixture(scope='module')
+def approved_clips(app, tmp_path_factory):
+    """One approved WAV clip and one approved FLAC clip, with their durations recorded"""
+    folder = tmp_path_factory.mktemp('shard_clips')
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').one()
+        audio = Audio(filename='shards.wav', original_path='-', status='processed', uploader_id=admin.id)
+        db.session.add(audio)
+        db.session.flush()
+        for order, (fmt, frame_count) in enumerate(CLIP_FRAMES.items(), 1):
+            wav_path = folder / f'clip_{order}.wav'
+            samples = (np.sin(np.arange(frame_count) * 0.05) * 8000).astype('<i2')
+            wav_path.write_bytes(wav_header(frame_count, 16000) + samples.tobytes())
+            path = folder / f'clip_{order}.{fmt}'
+            if fmt != 'wav':
+                subprocess.run(['ffmpeg', '-nostdin', '-v', 'error', '-i', str(wav_path), '-y', str(path)], check=True)
+            clip = Clip(audio_id=audio.id, filename=path.name, path=str(path), order=order, status='completed',
+                        duration=frame_count / 16000, sample_rate=16000)
+            db.session.add(clip)
+            db.session.flush()
+            db.session.add(Transcription(clip_id=clip.id, transcriber_id=admin.id, text=f'clip {order}',
+                                         status='approved'))
+        db.session.commit()
+    return sum(CLIP_FRAMES.values()) / 16000
+
+
+def _export(app, output_dir):
+    with app.app_context():
+        return shards.export_shards(str(output_dir), val_fraction=0, processes=1)
+
+
+def test_durations_come_from_the_clips(app, approved_clips, tmp_path, monkeypatch):
+    monkeypatch.setattr(shards, 'PYARROW_AVAILABLE', False)
+    summary = _export(app, tmp_path)
+
+    with open(tmp_path / 'manifest.jsonl', encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+    assert sorted(row['duration'] for row in rows) == sorted(frames / 16000 for frames in CLIP_FRAMES.values())
+    assert summary['manifest'] == 'manifest.jsonl'
+    assert summary['splits']['train']['samples'] == 2
+    assert summary['splits']['train']['hours'] == round(approved_clips / 3600, 3)
+
+
+def test_parquet_manifest(app, approved_clips, tmp_path):
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+
+    summary = _export(app, tmp_path)
+
+    assert summary['manifest'] == 'manifest.parquet'
+    table = pq.read_table(tmp_path / 'manifest.parquet')
+    assert table.column_names == shards.MANIFEST_COLUMNS
+    assert sorted(table.column('duration').to_pylist()) == sorted(frames / 16000 for frames in CLIP_FRAMES.values())
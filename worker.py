@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+import os
+import sys
+import signal
+import logging
+import argparse
+import multiprocessing
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] %(levelname)s %(processName)s - %(message)s',
+    handlers=[logging.StreamHandler(sys.stdout)]
+)
+logger = logging.getLogger(__name__)
+
+# Load the VAD model before forking the worker processes (on by default). The web
+# tier has its own switch, WEB_VAD_PRELOAD, so the two can share one env file.
+VAD_PRELOAD = os.environ.get("WORKER_VAD_PRELOAD", "1") == "1"
+
+
+def _worker_main(index, poll_interval):
+    """Entry point of a single worker process"""
+    from app import db, app
+    from jobs import run_worker
+
+    # Connections inherited from the parent must not be shared across processes
+    with app.app_context():
+        db.engine.dispose()
+
+    # Weights were loaded by the parent; run the first inference here, after the fork
+    if VAD_PRELOAD:
+        from audio_processor import warm_up_vad_model
+        warm_up_vad_model(run_inference=True)
+
+    # Segmentation timings live in this process; worker i serves them on WORKER_METRICS_PORT + i
+    metrics_port = os.environ.get("WORKER_METRICS_PORT")
+    if metrics_port:
+        from metrics import start_metrics_server
+        start_metrics_server(int(metrics_port) + index)
+
+    stop_event = multiprocessing.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    run_worker(worker_id=f"{os.uname().nodename}:{os.getpid()}:{index}",
+               poll_interval=poll_interval,
+               stop_event=stop_event)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the audio segmentation worker pool")
+    parser.add_argument('--processes', type=int,
+                        default=int(os.environ.get("WORKER_PROCESSES", 1)),
+                        help="Number of worker processes (default: $WORKER_PROCESSES or 1)")
+    parser.add_argument('--poll-interval', type=float,
+                        default=float(os.environ.get("WORKER_POLL_INTERVAL", 2.0)),
+                        help="Seconds to sleep when the queue is empty")
+    parser.add_argument('--schema-timeout', type=float,
+                        default=float(os.environ.get("WORKER_SCHEMA_TIMEOUT", 300)),
+                        help="Seconds to wait for the database schema to be initialized (by init_db.py)")
+    args = parser.parse_args()
+
+    # On a fresh deploy the web service's prestart.sh may still be creating the tables
+    from init_db import wait_for_schema
+    try:
+        wait_for_schema(timeout=args.schema_timeout)
+    except RuntimeError as e:
+        logger.error(str(e))
+        return 1
+
+    if VAD_PRELOAD:
+        # Load the model once before forking so every worker shares the weights copy-on-write
+        from audio_processor import warm_up_vad_model
+        warm_up_vad_model(run_inference=False)
+
+    logger.info(f"Starting {args.processes} segmentation worker process(es)")
+    # Fork explicitly: the preloaded model is only shared with children created by fork()
+    context = multiprocessing.get_context("fork")
+    processes = []
+    for i in range(args.processes):
+        p = context.Process(target=_worker_main, args=(i, args.poll_interval),
+                            name=f"worker-{i}")
+        p.start()
+        processes.append(p)
+
+    def shutdown(*_):
+        logger.info("Shutting down worker pool...")
+        for p in processes:
+            if p.is_alive():
+                p.terminate()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    for p in processes:
+        p.join()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())